@@ -1,31 +1,92 @@
 import os
+import time
+import tensorflow as tf
 from tensorflow import keras
-from collections import deque
 import numpy as np
-from datetime import datetime
-from get_state import get_state_12_normalized_numba
+from get_state import STATE_ENCODERS
 from get_action import get_action_safe
+from replay_buffer import (ReplayBuffer, PrioritizedReplayBuffer,
+                           StateCodec, NStepAccumulator)
+from inference import NumpyPolicy
+from prefetch import BatchPrefetcher
+from checkpoint import (CheckpointWriter, create_model_folder,
+                        load_npz_checkpoint, warn_map_size)
 
 
 class SnakeAgent:
     INPUT_SIZE = 12
     OUTPUT_SIZE = 4
     BATCH_SIZE = 64
+    GAMMA = 0.95
 
-    def __init__(self, board, first_layer=32, second_layer=16):
+    def __init__(self, board, first_layer=32, second_layer=16,
+                 memory_size=10000, prioritized_replay=False,
+                 target_update='soft', tau=0.01, target_update_interval=None,
+                 policy_sync_interval=1, keep_checkpoints=5,
+                 checkpoint_history=100, checkpoint_format='keras',
+                 state_encoder='12_normalized', packed_replay=False,
+                 prefetch=0, n_step=1):
         self.board = board
+        self.state_encoder = state_encoder
+        self.encoder = STATE_ENCODERS[state_encoder]
+        self.INPUT_SIZE = self.encoder.size
         self.first_layer = first_layer
         self.second_layer = second_layer
         self.model = self._create_model()
         self.epsilon = 1.0
         self.epsilon_min = 0.01
         self.epsilon_decay = 0.9998
-        self.memory = deque(maxlen=10000)
+        self.prioritized_replay = prioritized_replay
+        self.memory_size = memory_size
+        self.packed_replay = packed_replay
+        self.n_step = n_step
+        self._init_memory()
         self.target_model = self._create_model()
         self.update_target_counter = 0
+        if target_update_interval is None:
+            target_update_interval = 1000 if target_update == 'hard' else 1
+        elif target_update == 'hard' and target_update_interval <= 1:
+            raise ValueError("A hard target update every step makes the "
+                             "target network the online one")
+        self.target_update_interval = max(1, target_update_interval)
+        # a hard update is a soft one that takes all of the online weights
+        self._target_tau = tf.constant(
+            1.0 if target_update == 'hard' else tau, dtype=tf.float32)
+        self._no_target_update = tf.constant(0.0, dtype=tf.float32)
         self.evaluation_mode = False
         self.folder_name = 'models'
+        self.keep_checkpoints = keep_checkpoints
+        self.checkpoint_history = checkpoint_history
+        self.checkpoint_format = checkpoint_format
+        self.checkpoints = None
+        self.policy = NumpyPolicy.from_keras(self.model)
+        self.policy_sync_interval = max(1, policy_sync_interval)
+        self.policy_sync_counter = 0
+        self.updates = 0  # gradient steps taken
+        if prefetch < 0:
+            raise ValueError("prefetch is a number of batches, 0 or more")
+        self.prefetch = prefetch  # batches sampled ahead, 0 for none
+        self.prefetcher = None
+        self.profiler = None
         self._init_replay_buffers(self.BATCH_SIZE)
+        self._build_train_step()
+
+    def _init_memory(self):
+        """Empty replay memory for the current state encoder"""
+        self.codec = None
+        if self.packed_replay:
+            self.codec = StateCodec.for_encoder(
+                self.encoder, self.board.size_y, self.board.size_x)
+        if self.prioritized_replay:
+            self.memory = PrioritizedReplayBuffer(
+                self.memory_size, self.INPUT_SIZE, codec=self.codec)
+        else:
+            self.memory = ReplayBuffer(self.memory_size, self.INPUT_SIZE,
+                                       self.codec)
+        self.n_step_memory = None
+        if self.n_step > 1:
+            self.n_step_memory = NStepAccumulator(self.memory, self.n_step,
+                                                  self.GAMMA)
 
     def _init_replay_buffers(self, max_batch_size):
         self.replay_states = np.zeros(
@@ -37,6 +98,8 @@ class SnakeAgent:
             (max_batch_size, self.INPUT_SIZE), dtype=np.float32
         )
         self.replay_dones = np.zeros(max_batch_size, dtype=np.bool_)
+        self.replay_horizons = np.zeros(max_batch_size, dtype=np.uint8)
+        self.replay_weights = np.ones(max_batch_size, dtype=np.float32)
         self.max_batch_size = max_batch_size
 
     def _create_model(self):
@@ -54,102 +117,229 @@ class SnakeAgent:
         model.compile(optimizer='adam', loss='mse', jit_compile=True)
         return model
 
+    def _build_train_step(self):
+        """Compile target, Bellman backup, loss and update into one graph.
+
+        The loss is the same as fitting 'mse' on the predicted Q values
+        with only the taken action replaced by its target: the other
+        three columns have zero error, hence the division by OUTPUT_SIZE.
+        The target network then moves towards the online one by tau
+        (0 leaves it as is, 1 copies it) with in-place assignments.
+        rewards are horizon-step returns, so the bootstrap is discounted
+        by gamma ** horizons.
+        """
+        model = self.model
+        target_model = self.target_model
+        optimizer = model.optimizer
+        optimizer.build(model.trainable_variables)
+        gamma = self.GAMMA
+        output_size = self.OUTPUT_SIZE
+
+        @tf.function(jit_compile=True)
+        def train_step(states, actions, rewards, next_states, dones,
+                       horizons, weights, tau):
+            next_q = target_model(next_states, training=False)
+            not_done = 1.0 - tf.cast(dones, tf.float32)
+            discounts = tf.pow(gamma, tf.cast(horizons, tf.float32))
+            targets = rewards + discounts * tf.reduce_max(next_q, axis=1) * (
+                not_done)
+
+            with tf.GradientTape() as tape:
+                q_values = model(states, training=True)
+                q_taken = tf.gather(q_values, actions, axis=1, batch_dims=1)
+                td_errors = targets - q_taken
+                loss = tf.reduce_mean(
+                    weights * tf.square(td_errors)) / output_size
+
+            gradients = tape.gradient(loss, model.trainable_variables)
+            optimizer.apply_gradients(
+                zip(gradients, model.trainable_variables))
+
+            for target_var, var in zip(target_model.trainable_variables,
+                                       model.trainable_variables):
+                target_var.assign(tau * var + (1.0 - tau) * target_var)
+            return td_errors
+
+        self._train_step = train_step
+
     def get_state(self):
-        directions = np.array(self.board.DIRECTIONS, dtype=np.int8)
-        return get_state_12_normalized_numba(
-            self.board.head_y, self.board.head_x, self.board.table,
-            directions, self.board.TAIL, self.board.APPLE,
-            self.board.size_y, self.board.size_x
-        )
+        return self.encoder.encode(self.board)
 
     def get_action(self, state):
         return get_action_safe(self, state)
 
     def remember(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))
+        memory = self.n_step_memory or self.memory
+        if self.prefetcher is None:
+            memory.append(state, action, reward, next_state, done)
+            return
+        with self.prefetcher.lock:
+            memory.append(state, action, reward, next_state, done)
+
+    def end_episode(self):
+        """Store the n-step transitions of an episode cut short"""
+        if self.n_step_memory is None:
+            return
+        if self.prefetcher is None:
+            self.n_step_memory.flush()
+            return
+        with self.prefetcher.lock:
+            self.n_step_memory.flush()
 
     def set_folder_name(self, name):
-        base_path = os.path.join("models", name)
-        if os.path.exists(base_path) and os.path.isdir(base_path):
-            i = 2
-            while (os.path.exists(f"{base_path}{i}") and
-                   os.path.isdir(f"{base_path}{i}")):
-                i += 1
-            self.folder_name = f"{name}{i}"
-        else:
-            self.folder_name = name
-        os.makedirs("models", exist_ok=True)
-        os.makedirs(os.path.join("models", self.folder_name), exist_ok=True)
+        self.folder_name = create_model_folder(name)
 
     def save_model(self, episode):
-        timestamp = datetime.now().strftime("%Y%m%d_%H:%M")
-        model_path = os.path.join(
-            "models", self.folder_name,
-            f"snake_model_{episode}_{timestamp}.keras"
-        )
-        self.model.save(model_path)
-        print(f"Model saved to {model_path}")
+        """Queue a snapshot of the weights for the checkpoint writer"""
+        if self.checkpoints is None:
+            # same architecture as the network, loaded models included
+            scratch = keras.models.clone_model(self.model)
+            scratch.compile(optimizer='adam', loss='mse', jit_compile=True)
+            self.checkpoints = CheckpointWriter(
+                os.path.join("models", self.folder_name),
+                scratch, keep_last=self.keep_checkpoints,
+                keep_every=self.checkpoint_history,
+                checkpoint_format=self.checkpoint_format,
+                activations=self.policy.activations
+            )
+        self.checkpoints.save(episode, self.model.get_weights(),
+                              self.checkpoint_metadata())
+
+    def checkpoint_metadata(self):
+        return {
+            'epsilon': self.epsilon,
+            'map_height': self.board.size_y,
+            'map_width': self.board.size_x,
+            'state_encoder': self.state_encoder,
+        }
+
+    def mark_best_model(self, episode):
+        if self.checkpoints is not None:
+            self.checkpoints.mark_best(episode)
+
+    def close(self):
+        """Wait for pending checkpoint writes"""
+        if self.checkpoints is not None:
+            self.checkpoints.close()
+            self.checkpoints = None
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
 
     def load_model(self, model_path):
         if os.path.exists(model_path):
             try:
-                self.model = keras.models.load_model(model_path)
-                self.target_model = keras.models.load_model(model_path)
+                if model_path.endswith('.npz'):
+                    self._load_npz(model_path)
+                else:
+                    self.model = keras.models.load_model(model_path)
+                    self.target_model = keras.models.clone_model(self.model)
+                    self.target_model.set_weights(self.model.get_weights())
+                if self.model.input_shape[-1] != self.INPUT_SIZE:
+                    raise ValueError("Model input does not match the "
+                                     "state encoder")
                 self.epsilon = 0.1  # self.epsilon_min
-            except Exception:
+                self.policy = NumpyPolicy.from_keras(self.model)
+                self._build_train_step()
+            except Exception as e:
                 import sys
-                print("\033[91mFailed to load model\033[0m")
+                print(f"\033[91mFailed to load model: {e}\033[0m")
                 sys.exit(1)
         else:
             import sys
             print("\033[91mFailed to load model\033[0m")
             sys.exit(1)
 
+    def _load_npz(self, model_path):
+        """Rebuild both networks from one weights-only checkpoint.
+
+        The agent switches to the state encoder the checkpoint was trained
+        on, as long as its replay memory is still empty.
+        """
+        weights, _, metadata = load_npz_checkpoint(model_path)
+        state_encoder = metadata.get('state_encoder', self.state_encoder)
+        if state_encoder != self.state_encoder:
+            if len(self.memory) > 0:
+                raise ValueError(f"checkpoint trained on the {state_encoder} "
+                                 f"state encoder, not {self.state_encoder}")
+            self.state_encoder = state_encoder
+            self.encoder = STATE_ENCODERS[state_encoder]
+            self.INPUT_SIZE = self.encoder.size
+            self._init_memory()
+            self._init_replay_buffers(self.max_batch_size)
+        warn_map_size(metadata, self.encoder, self.board)
+        layer_sizes = [weights[0].shape[0]] + [
+            kernel.shape[1] for kernel in weights[::2]
+        ]
+        self.first_layer = layer_sizes[1]
+        self.second_layer = layer_sizes[2] if len(layer_sizes) > 3 else 0
+        self.model = self._create_model()
+        self.model.set_weights(weights)
+        self.target_model = self._create_model()
+        self.target_model.set_weights(weights)
+
     def train(self, state, action, reward, next_state, done):
         self.remember(state, action, reward, next_state, done)
         self.replay(self.BATCH_SIZE)
 
+    def _next_prefetched_batch(self):
+        """Batch from the prefetch thread, started on the first call"""
+        if self.prefetcher is None:
+            self.prefetcher = BatchPrefetcher(
+                self.memory, self.BATCH_SIZE, self.INPUT_SIZE,
+                self.prefetch, self.prioritized_replay)
+        start = time.perf_counter()
+        batch = self.prefetcher.next_batch()
+        if self.profiler:
+            self.profiler.add('replay_wait', time.perf_counter() - start)
+            self.profiler.add('prefetch', self.prefetcher.take_busy_time())
+        return batch
+
     def replay(self, batch_size):
         if len(self.memory) < batch_size:
             return
 
-        indices = np.random.choice(len(self.memory), batch_size, replace=False)
+        if self.prefetch > 0 and batch_size == self.BATCH_SIZE:
+            batch, indices, weights = self._next_prefetched_batch()
+        else:
+            indices = self.memory.sample_indices(batch_size)
+            batch = self.memory.gather(indices, out=(
+                self.replay_states[:batch_size],
+                self.replay_actions[:batch_size],
+                self.replay_rewards[:batch_size],
+                self.replay_next_states[:batch_size],
+                self.replay_dones[:batch_size],
+                self.replay_horizons[:batch_size],
+            ))
+            weights = None
+            if self.prioritized_replay:
+                weights = self.memory.importance_weights(indices)
+        if weights is None:
+            weights = self.replay_weights[:batch_size]
 
-        states = self.replay_states[:batch_size]
-        actions = self.replay_actions[:batch_size]
-        rewards = self.replay_rewards[:batch_size]
-        next_states = self.replay_next_states[:batch_size]
-        dones = self.replay_dones[:batch_size]
+        self.update_target_counter += 1
+        if self.update_target_counter >= self.target_update_interval:
+            self.update_target_counter = 0
+            tau = self._target_tau
+        else:
+            tau = self._no_target_update
 
-        for i, idx in enumerate(indices):
-            experience = self.memory[idx]
-            states[i] = experience[0]
-            actions[i] = experience[1]
-            rewards[i] = experience[2]
-            next_states[i] = experience[3]
-            dones[i] = experience[4]
+        td_errors = self._train_step(*batch, weights, tau)
 
-        current_q_values = self.model(states, training=False).numpy()
-        next_q_values = self.target_model(next_states, training=False).numpy()
+        self.updates += 1
 
-        max_next_q = np.max(next_q_values, axis=1)
-        targets = np.where(
-            dones, rewards, rewards + 0.95 * max_next_q
-        )
+        if self.prioritized_replay:
+            td_errors = td_errors.numpy()
+            if self.prefetcher is None:
+                self.memory.update_priorities(indices, td_errors)
+            else:
+                with self.prefetcher.lock:
+                    self.memory.update_priorities(indices, td_errors)
 
-        for i in range(batch_size):
-            current_q_values[i, actions[i]] = targets[i]
-
-        self.model.fit(
-            states, current_q_values, epochs=1, verbose=0,
-            batch_size=batch_size
-        )
+        self.policy_sync_counter += 1
+        if self.policy_sync_counter >= self.policy_sync_interval:
+            self.policy_sync_counter = 0
+            self.policy.set_weights(self.model.get_weights())
 
         if self.epsilon > self.epsilon_min:
             self.epsilon *= self.epsilon_decay
-
-        new_weights = []
-        target_weights = self.target_model.get_weights()
-        for i, model_weights in enumerate(self.model.get_weights()):
-            new_weights.append(0.01 * model_weights + 0.99 * target_weights[i])
-        self.target_model.set_weights(new_weights)
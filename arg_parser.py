@@ -12,6 +12,11 @@ def setup_argparser():
                         help='Path to model to load')
     parser.add_argument('--name', '-n', type=str, default='model',
                         help='Name of model folder')
+    parser.add_argument('--agent', '-ag', type=str, default='dqn',
+                        choices=['dqn', 'tabular'],
+                        help='Keras DQN or tabular Q-learning')
+    parser.add_argument('--learning_rate', '-lr', type=float, default=0.1,
+                        help='Q-learning step size of the tabular agent')
     parser.add_argument('--first_layer', '-fl', type=int, default=32,
                         help='Number of neurons in the first layer')
     parser.add_argument('--second_layer', '-sl', type=int, default=16,
@@ -28,4 +33,73 @@ def setup_argparser():
                         help='Height of the map (3-13)')
     parser.add_argument('--show_history', '-sh', action='store_true',
                         help='Show training history plot after training')
+    parser.add_argument('--board_engine', '-be', type=str, default='python',
+                        choices=['python', 'numba'],
+                        help='Board implementation to play on')
+    parser.add_argument('--state_encoder', '-se', type=str,
+                        default='12_normalized',
+                        choices=['12_normalized', '16_normalized', '16bits'],
+                        help='State encoding fed to the network')
+    parser.add_argument('--memory_size', '-ms', type=int, default=10000,
+                        help='Capacity of the replay memory in transitions')
+    parser.add_argument('--prioritized_replay', '-pr', action='store_true',
+                        help='Sample replay memory by TD error priority')
+    parser.add_argument('--packed_replay', '-pk', action='store_true',
+                        help='Keep replay states bit-packed, decoded when '
+                             'sampled')
+    parser.add_argument('--n_step', '-ns', type=int, default=1,
+                        help='Steps of reward summed before bootstrapping '
+                             '(1 to 255)')
+    parser.add_argument('--prefetch', '-pb', type=int, default=0,
+                        help='Replay batches a background thread samples '
+                             'ahead (0: sample in the train step)')
+    parser.add_argument('--target_update', '-tu', type=str, default='soft',
+                        choices=['soft', 'hard'],
+                        help='Blend the target network by tau or copy it')
+    parser.add_argument('--tau', type=float, default=0.01,
+                        help='Soft target update rate')
+    parser.add_argument('--target_update_interval', '-ti', type=int,
+                        default=None,
+                        help='Training steps between target updates '
+                             '(default 1 soft, 1000 hard)')
+    parser.add_argument('--policy_sync_interval', '-ps', type=int, default=1,
+                        help='Training steps between copies of the weights '
+                             'to the NumPy action-selection policy')
+    parser.add_argument('--eval_workers', '-ew', type=int, default=1,
+                        help='Processes playing the periodic evaluation '
+                             'games (1 plays them in the training process)')
+    parser.add_argument('--eval_seed', type=int, default=0,
+                        help='Base seed of the evaluation workers')
+    parser.add_argument('--compiled_evaluation', '-ce', action='store_true',
+                        help='Play greedy evaluation games in one compiled '
+                             'loop (ignored with graphics)')
+    parser.add_argument('--policy_table', '-pt', action='store_true',
+                        help='Evaluate with a lookup table of the greedy '
+                             'action of every state (12_normalized DQN '
+                             'only, the tabular agent is one already)')
+    parser.add_argument('--actors', '-a', type=int, default=0,
+                        help='Actor processes feeding a shared replay '
+                             'memory (0 trains in a single process)')
+    parser.add_argument('--actor_refresh_interval', '-ar', type=int,
+                        default=100,
+                        help='Steps between policy weight refreshes '
+                             'in the actors')
+    parser.add_argument('--keep_checkpoints', '-kc', type=int, default=5,
+                        help='Number of latest checkpoints to keep')
+    parser.add_argument('--checkpoint_history', '-ch', type=int,
+                        default=100,
+                        help='Also keep every checkpoint whose episode is '
+                             'a multiple of this (0 keeps none)')
+    parser.add_argument('--checkpoint_format', '-cf', type=str,
+                        default=None, choices=['keras', 'npz'],
+                        help='Full .keras models (default) or weights-only '
+                             '.npz files, DQN only')
+    parser.add_argument('--import_timing', '-it', action='store_true',
+                        help='Print how long each startup import took')
+    parser.add_argument('--profile', '-pf', action='store_true',
+                        help='Time each training phase, write profile.txt '
+                             'and print a summary every 100 episodes')
+    parser.add_argument('--warmup', '-wu', action='store_true',
+                        help='Load or compile the numba kernels before '
+                             'the first episode')
     return parser
@@ -0,0 +1,486 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+from functools import partial
+from datetime import datetime
+import numpy as np
+from board import init_board
+from numba_board import (init_numba_board, set_cell_nb, HEAD_Y, HEAD_X,
+                         TAIL_Y, TAIL_X, LENGTH, BODY_START, MOVING_DIR,
+                         FREE_COUNT, FREE_CELLS, FREE_POS)
+from vec_board import init_vec_board
+from get_state import (STATE_ENCODERS, DIRECTIONS_ARRAY,
+                       get_state_12_normalized_numba,
+                       get_state_16_normalized_numba)
+from inference import NumpyPolicy, PolicyAgent
+from replay_buffer import ReplayBuffer, StateCodec
+from rollout import rollout_games
+from training import calculate_reward
+
+SEED = 42
+MAP_SIZES = [(10, 10), (13, 24)]
+ENGINES = {'python': init_board, 'numba': init_numba_board}
+# reference results, refresh with --output benchmarks/baseline.json
+BASELINE_PATH = os.path.join('benchmarks', 'baseline.json')
+
+
+def seed_everything(seed=SEED):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def snake_path(map_height, map_width):
+    """Every cell once, row by row, turning at the ends like a snake"""
+    path = []
+    for y in range(map_height):
+        columns = range(map_width) if y % 2 == 0 else range(map_width - 1,
+                                                            -1, -1)
+        path.extend((y, x) for x in columns)
+    return path
+
+
+def lay_snake(board, length):
+    """Replace the snake by one of the given length along snake_path.
+
+    Food is then placed at random, so a seeded run gives the same board.
+    """
+    size_y, size_x = board.size_y, board.size_x
+    segments = snake_path(size_y, size_x)[:length]
+    (tail_y, tail_x), (head_y, head_x) = segments[0], segments[-1]
+    before_y, before_x = segments[-2]
+    moving_dir = init_board.DIRECTIONS.index(
+        (head_y - before_y, head_x - before_x))
+
+    if isinstance(board, init_numba_board):
+        board.table[:] = board.EMPTY
+        board.bitboards[:] = 0
+        board.free[FREE_CELLS] = np.arange(size_y * size_x)
+        board.free[FREE_POS] = np.arange(size_y * size_x)
+        board.state[FREE_COUNT] = size_y * size_x
+        for y, x in segments:
+            set_cell_nb(board.table, board.free, board.bitboards,
+                        board.state, y, x, board.TAIL)
+        set_cell_nb(board.table, board.free, board.bitboards, board.state,
+                    head_y, head_x, board.HEAD)
+        board.body[:length] = segments
+        board.state[BODY_START] = 0
+        board.state[LENGTH] = length
+        board.state[HEAD_Y], board.state[HEAD_X] = head_y, head_x
+        board.state[TAIL_Y], board.state[TAIL_X] = tail_y, tail_x
+        board.state[MOVING_DIR] = moving_dir
+        board.set_cell_to_random_empty(board.APPLE)
+        board.set_cell_to_random_empty(board.APPLE)
+    else:
+        board.table = np.zeros((size_y, size_x), dtype='int8')
+        board._init_free_cells()
+        board._init_bitboards()
+        for y, x in segments:
+            board._set_cell(y, x, board.TAIL)
+        board._set_cell(head_y, head_x, board.HEAD)
+        board.snake_segments = list(segments)
+        board.length = length
+        board.head_y, board.head_x = head_y, head_x
+        board.tail_y, board.tail_x = tail_y, tail_x
+        board.moving_dir = moving_dir
+        board.apple_1 = board.set_cell_to_random_empty(board.APPLE)
+        board.apple_2 = board.set_cell_to_random_empty(board.APPLE)
+    board.set_cell_to_random_empty(board.PEPPER)
+    return board
+
+
+def snake_lengths(map_height, map_width):
+    """Fresh, half-full and near-full boards (three free cells for food)"""
+    cells = map_height * map_width
+    return [3, cells // 2, cells - 4]
+
+
+def safe_actions(board):
+    actions = []
+    for i, (dy, dx) in enumerate(board.DIRECTIONS):
+        y, x = board.head_y + dy, board.head_x + dx
+        if 0 <= y < board.size_y and 0 <= x < board.size_x:
+            on_tail = y == board.tail_y and x == board.tail_x
+            if board.table[y, x] != board.TAIL or on_tail:
+                actions.append(i)
+    return actions
+
+
+def random_policy(layer_sizes):
+    rng = np.random.default_rng(SEED)
+    weights = []
+    for inputs, outputs in zip(layer_sizes, layer_sizes[1:]):
+        weights.append(rng.normal(0, 0.3, (inputs, outputs)))
+        weights.append(np.zeros(outputs))
+    activations = ['relu'] * (len(layer_sizes) - 2) + ['linear']
+    return NumpyPolicy(weights, activations)
+
+
+def best_time(run, number, repeat):
+    """Fastest of repeat runs of run(number), in seconds per operation.
+
+    run returns the time it measured itself, so setup work between the
+    timed calls stays out of the result.
+    """
+    return min(run(number) for _ in range(repeat)) / number
+
+
+def bench_make_move(engine, map_height, map_width, length):
+    board = ENGINES[engine](map_height, map_width)
+
+    def run(number):
+        seed_everything()
+        lay_snake(board, length)
+        elapsed = 0.0
+        for _ in range(number):
+            actions = safe_actions(board)
+            if not actions:
+                lay_snake(board, length)
+                actions = safe_actions(board)
+            action = random.choice(actions)
+            start = time.perf_counter()
+            done = board.make_move(action)
+            elapsed += time.perf_counter() - start
+            if done:
+                lay_snake(board, length)
+        return elapsed
+    return run
+
+
+def bench_set_cell_to_random_empty(engine, map_height, map_width, length):
+    board = ENGINES[engine](map_height, map_width)
+
+    def run(number):
+        seed_everything()
+        lay_snake(board, length)
+        elapsed = 0.0
+        for _ in range(number):
+            start = time.perf_counter()
+            cell = board.set_cell_to_random_empty(board.APPLE)
+            elapsed += time.perf_counter() - start
+            if engine == 'numba':
+                set_cell_nb(board.table, board.free, board.bitboards,
+                            board.state, cell[0], cell[1], board.EMPTY)
+            else:
+                board._set_cell(cell[0], cell[1], board.EMPTY)
+        return elapsed
+    return run
+
+
+def bench_encoder(encode, map_height, map_width, length):
+    board = lay_snake(init_board(map_height, map_width), length)
+
+    def run(number):
+        start = time.perf_counter()
+        for _ in range(number):
+            encode(board)
+        return time.perf_counter() - start
+    return run
+
+
+def raycast_encoders():
+    """The table-walking kernels, for comparison with the bitboard ones"""
+    def encode_12(board):
+        return get_state_12_normalized_numba(
+            board.head_y, board.head_x, board.table, DIRECTIONS_ARRAY,
+            board.TAIL, board.APPLE, board.size_y, board.size_x)
+
+    def encode_16(board):
+        return get_state_16_normalized_numba(
+            board.head_y, board.head_x, board.table, board.tail_y,
+            board.tail_x, DIRECTIONS_ARRAY, board.TAIL, board.APPLE,
+            board.PEPPER, board.size_y, board.size_x)
+    return {'12_raycast': encode_12, '16_raycast': encode_16}
+
+
+def bench_encoder_batch(encoder, map_height, map_width, num_boards):
+    boards = init_vec_board(num_boards, map_height, map_width, seed=SEED)
+    out = np.empty((boards.num_boards, encoder.size), dtype=np.float32)
+
+    def run(number):
+        start = time.perf_counter()
+        for _ in range(number):
+            encoder.encode_batch(boards, out)
+        return time.perf_counter() - start
+    return run
+
+
+def bench_get_action_safe(map_height, map_width):
+    board = init_board(map_height, map_width)
+    agent = PolicyAgent(board, random_policy([12, 32, 16, 4]))
+    agent.epsilon = 0.1
+
+    def run(number):
+        seed_everything()
+        board.reset()
+        state = agent.get_state()
+        start = time.perf_counter()
+        for _ in range(number):
+            agent.get_action(state)
+        return time.perf_counter() - start
+    return run
+
+
+def bench_env_steps(engine, map_height, map_width):
+    """Acting loop of training without the learning: state, action, move,
+    reward, next state and a replay memory write"""
+    board = ENGINES[engine](map_height, map_width)
+    agent = PolicyAgent(board, random_policy([12, 32, 16, 4]))
+    agent.epsilon = 0.1
+    memory = ReplayBuffer(10000, 12)
+
+    def run(number):
+        seed_everything()
+        board.reset()
+        state = agent.get_state()
+        steps_no_food = 0
+        start = time.perf_counter()
+        for _ in range(number):
+            action = agent.get_action(state)
+            old_length = board.length
+            done = board.make_move(action)
+            reward = calculate_reward(board, old_length, done)
+            steps_no_food = 0 if board.length > old_length else (
+                steps_no_food + 1)
+            next_state = agent.get_state()
+            memory.append(state, action, reward, next_state, done)
+            state = next_state
+            if done or steps_no_food >= 100:
+                board.reset()
+                state = agent.get_state()
+                steps_no_food = 0
+        return time.perf_counter() - start
+    return run
+
+
+def bench_replay(prioritized):
+    from tensorflow import keras
+    from agent import SnakeAgent
+
+    keras.utils.set_random_seed(SEED)
+    agent = SnakeAgent(init_board(10, 10), prioritized_replay=prioritized)
+    rng = np.random.default_rng(SEED)
+    for _ in range(5000):
+        agent.remember(rng.random(12), rng.integers(4), rng.normal(),
+                       rng.random(12), rng.random() < 0.1)
+    agent.replay(agent.BATCH_SIZE)  # trace the train step
+
+    def run(number):
+        seed_everything()
+        start = time.perf_counter()
+        for _ in range(number):
+            agent.replay(agent.BATCH_SIZE)
+        return time.perf_counter() - start
+    return run
+
+
+def bench_replay_gather(packed):
+    """Batch of 64 from a full memory of a million transitions"""
+    encoder = STATE_ENCODERS['12_normalized']
+    codec = StateCodec.for_encoder(encoder, 10, 10) if packed else None
+    memory = ReplayBuffer(1000000, encoder.size, codec)
+    board = init_board(10, 10)
+    lay_snake(board, 10)
+    state = encoder.encode(board)
+    for _ in range(memory.capacity):
+        memory.append(state, 0, 0.0, state, False)
+    out = ReplayBuffer(64, encoder.size).gather(np.arange(64))
+
+    def run(number):
+        seed_everything()
+        start = time.perf_counter()
+        for _ in range(number):
+            memory.gather(memory.sample_indices(64), out)
+        return time.perf_counter() - start
+    return run
+
+
+def bench_tabular_replay():
+    """Replay step of the tabular agent, batch sampling included"""
+    from tabular_agent import TabularAgent
+    from policy_table import enumerate_states
+
+    agent = TabularAgent(init_board(10, 10))
+    rng = np.random.default_rng(SEED)
+    size = len(agent.greedy)
+    for _ in range(5000):
+        state, next_state = (enumerate_states(10, code, code + 1)[0]
+                             for code in rng.integers(size, size=2))
+        agent.remember(state, rng.integers(4), rng.normal(), next_state,
+                       rng.random() < 0.1)
+
+    def run(number):
+        seed_everything()
+        start = time.perf_counter()
+        for _ in range(number):
+            agent.replay(agent.BATCH_SIZE)
+        return time.perf_counter() - start
+    return run
+
+
+def bench_rollout(map_height, map_width):
+    """Greedy games in the compiled loop, per environment step"""
+    policy = random_policy([12, 32, 16, 4])
+
+    def run(number):
+        steps = 0
+        elapsed = 0.0
+        seed = SEED
+        while steps < number:
+            start = time.perf_counter()
+            _, game_steps = rollout_games(policy, map_height, map_width,
+                                          100, seed=seed)
+            elapsed += time.perf_counter() - start
+            steps += int(game_steps.sum())
+            seed += 1
+        return elapsed * number / steps
+    return run
+
+
+def collect_benchmarks(include_tf):
+    """(name, setup, ops per repeat) of the whole suite.
+
+    setup builds the boards or agent and returns the run function, so
+    benchmarks left out by --only cost nothing.
+    """
+    cases = []
+    for map_height, map_width in MAP_SIZES:
+        size = f"{map_height}x{map_width}"
+        shape = (map_height, map_width)
+        for length in snake_lengths(map_height, map_width):
+            for engine in ENGINES:
+                cases.append((f"make_move/{engine}/{size}/len{length}",
+                              partial(bench_make_move, engine, *shape,
+                                      length), 5000))
+                cases.append((
+                    f"set_cell_to_random_empty/{engine}/{size}/len{length}",
+                    partial(bench_set_cell_to_random_empty, engine, *shape,
+                            length), 5000))
+            encoders = {name: encoder.encode
+                        for name, encoder in STATE_ENCODERS.items()}
+            encoders.update(raycast_encoders())
+            for name, encode in encoders.items():
+                cases.append((f"encoder/{name}/{size}/len{length}",
+                              partial(bench_encoder, encode, *shape, length),
+                              20000))
+
+        for name, encoder in STATE_ENCODERS.items():
+            cases.append((f"encoder_batch/{name}/{size}/n256",
+                          partial(bench_encoder_batch, encoder, *shape, 256),
+                          200))
+        cases.append((f"get_action_safe/{size}",
+                      partial(bench_get_action_safe, *shape), 20000))
+        for engine in ENGINES:
+            cases.append((f"env_steps/{engine}/{size}",
+                          partial(bench_env_steps, engine, *shape), 10000))
+        cases.append((f"rollout_step/{size}",
+                      partial(bench_rollout, *shape), 100000))
+
+    cases.append(("replay_gather/float32",
+                  partial(bench_replay_gather, False), 20000))
+    cases.append(("replay_gather/packed",
+                  partial(bench_replay_gather, True), 20000))
+    cases.append(("replay/tabular", bench_tabular_replay, 2000))
+    if include_tf:
+        cases.append(("replay/uniform", partial(bench_replay, False), 200))
+        cases.append(("replay/prioritized", partial(bench_replay, True), 200))
+    return cases
+
+
+def run_suite(cases, repeat, scale, only=None):
+    results = {}
+    for name, setup, number in cases:
+        if only and only not in name:
+            continue
+        run = setup()
+        number = max(1, int(number * scale))
+        run(max(1, number // 10))  # warm caches and compiled code
+        seconds = best_time(run, number, repeat)
+        results[name] = {'seconds': seconds, 'ops_per_s': 1.0 / seconds}
+        print(f"{name:<52} {seconds * 1e6:>12.2f} us "
+              f"{1.0 / seconds:>14.0f} /s")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print the change per benchmark, return the names that got slower"""
+    regressions = []
+    print(f"\n{'Benchmark':<52} {'Baseline us':>12} {'Now us':>10} "
+          f"{'Change':>8}")
+    print("-" * 85)
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]['seconds']
+        change = result['seconds'] / before - 1.0
+        slower = change > tolerance
+        if slower:
+            regressions.append(name)
+        print(f"{name:<52} {before * 1e6:>12.2f} "
+              f"{result['seconds'] * 1e6:>10.2f} {change:>+8.1%}"
+              f"{'  SLOWER' if slower else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the board, encoders, actions and training step")
+    parser.add_argument('--output', '-o', type=str,
+                        default='benchmark_results.json',
+                        help='JSON file to write the results to')
+    parser.add_argument('--baseline', '-b', type=str,
+                        default=BASELINE_PATH,
+                        help='Results JSON of an earlier run to compare to '
+                             '(empty string to skip)')
+    parser.add_argument('--tolerance', '-t', type=float, default=0.10,
+                        help='Slowdown over the baseline counted as a '
+                             'regression (0.10 = 10%%)')
+    parser.add_argument('--repeat', '-r', type=int, default=5,
+                        help='Runs per benchmark, the fastest one counts')
+    parser.add_argument('--quick', '-q', action='store_true',
+                        help='Tenth of the operations per run')
+    parser.add_argument('--only', type=str,
+                        help='Only benchmarks whose name contains this')
+    parser.add_argument('--no_tf', action='store_true',
+                        help='Skip the benchmarks that need TensorFlow')
+    args = parser.parse_args()
+
+    seed_everything()
+    cases = collect_benchmarks(include_tf=not args.no_tf)
+    results = run_suite(cases, max(1, args.repeat),
+                        0.1 if args.quick else 1.0, args.only)
+
+    report = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'repeat': args.repeat,
+            'quick': args.quick,
+            'seed': SEED,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"\nResults saved to {args.output}")
+
+    if args.baseline and not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, nothing to compare to")
+    elif args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\033[91m{len(regressions)} benchmark(s) slower than "
+                  f"the baseline by more than {args.tolerance:.0%}\033[0m")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
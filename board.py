@@ -22,6 +22,8 @@ class init_board:
         self.length = 3
         self.snake_segments = []  # from tail to head in tuple (y, x)
         self.last_move_random = False
+        self._init_free_cells()
+        self._init_bitboards()
 
         self._init_snake()
         self.apple_1 = self.set_cell_to_random_empty(self.APPLE)
@@ -39,6 +41,8 @@ class init_board:
         self.moving_dir = 0
         self.length = 3
         self.snake_segments = []
+        self._init_free_cells()
+        self._init_bitboards()
 
         self._init_snake()
 
@@ -49,6 +53,60 @@ class init_board:
 
         return self
 
+    def _init_free_cells(self):
+        """Every cell of an empty table is free"""
+        cells = self.size_y * self.size_x
+        self.free_cells = list(range(cells))  # flat indices y * size_x + x
+        self.free_pos = list(range(cells))  # index in free_cells or -1
+
+    def _init_bitboards(self):
+        """Occupancy bitmasks per cell value, all zero on an empty table.
+
+        bitboards[value, y] has bit x set when table[y, x] == value, and
+        bitboards[value, size_y + x] has bit y set. Only the cells a ray
+        from the head can hit are tracked: TAIL, APPLE and PEPPER.
+        """
+        if max(self.size_y, self.size_x) > 62:
+            raise ValueError("Bitboards need a map of at most 62 cells wide")
+        self.bitboards = np.zeros((self.PEPPER + 1,
+                                   self.size_y + self.size_x), dtype=np.int64)
+        # flat view of the same memory, much cheaper to update per cell
+        self._bits = memoryview(self.bitboards.reshape(-1))
+        stride = self.size_y + self.size_x
+        self._bits_row = [-1] * (self.PEPPER + 1)  # row offset per value
+        for value in (self.TAIL, self.APPLE, self.PEPPER):
+            self._bits_row[value] = value * stride
+
+    def _set_cell(self, y, x, value):
+        """Write a cell, keep the free-cell set and bitboards in sync"""
+        table = self.table
+        old = table.item(y, x)
+        table[y, x] = value
+        bits = self._bits
+        row = self._bits_row[old]
+        if row >= 0:
+            bits[row + y] &= ~(1 << x)
+            bits[row + self.size_y + x] &= ~(1 << y)
+        row = self._bits_row[value]
+        if row >= 0:
+            bits[row + y] |= 1 << x
+            bits[row + self.size_y + x] |= 1 << y
+        if (old == self.EMPTY) == (value == self.EMPTY):
+            return
+
+        cell = y * self.size_x + x
+        if value == self.EMPTY:
+            self.free_pos[cell] = len(self.free_cells)
+            self.free_cells.append(cell)
+        else:
+            # swap-remove: the last free cell takes the freed slot
+            pos = self.free_pos[cell]
+            last = self.free_cells.pop()
+            if last != cell:
+                self.free_cells[pos] = last
+                self.free_pos[last] = pos
+            self.free_pos[cell] = -1
+
     def _place_adjacent_segment(self, y, x):
         empty_cells = []
         size_y = self.size_y
@@ -79,33 +137,25 @@ class init_board:
 
         self.second_tail_y, self.second_tail_x = self._place_adjacent_segment(
             self.head_y, self.head_x)
-        self.table[self.second_tail_y][self.second_tail_x] = self.TAIL
+        self._set_cell(self.second_tail_y, self.second_tail_x, self.TAIL)
 
         self.tail_y, self.tail_x = self._place_adjacent_segment(
             self.second_tail_y, self.second_tail_x)
-        self.table[self.tail_y][self.tail_x] = self.TAIL
+        self._set_cell(self.tail_y, self.tail_x, self.TAIL)
 
         self.snake_segments.append((self.tail_y, self.tail_x))
         self.snake_segments.append((self.second_tail_y, self.second_tail_x))
         self.snake_segments.append((self.head_y, self.head_x))
 
     def set_cell_to_random_empty(self, value):
-        for _ in range(100):
-            y = random.randint(0, self.size_y - 1)
-            x = random.randint(0, self.size_x - 1)
-
-            if (0 <= y < self.size_y
-                    and 0 <= x < self.size_x
-                    and self.table[y][x] == self.EMPTY):
-                self.table[y][x] = value
-                return (y, x)
-
-        for y in range(self.size_y):
-            for x in range(self.size_x):
-                if self.table[y][x] == self.EMPTY:
-                    self.table[y][x] = value
-                    return (y, x)
-        return None
+        """Uniform draw from the free-cell set, O(1) at any occupancy"""
+        if not self.free_cells:
+            return None
+
+        cell = self.free_cells[random.randrange(len(self.free_cells))]
+        y, x = divmod(cell, self.size_x)
+        self._set_cell(y, x, value)
+        return (y, x)
 
     def make_move(self, action):
         dy = self.DIRECTIONS[action][0]
@@ -123,23 +173,23 @@ class init_board:
                 return True
             else:
                 self.snake_segments.append((new_y, new_x))
-                self.table[self.head_y][self.head_x] = self.TAIL
+                self._set_cell(self.head_y, self.head_x, self.TAIL)
 
-                self.table[self.tail_y][self.tail_x] = self.EMPTY
+                self._set_cell(self.tail_y, self.tail_x, self.EMPTY)
                 self.snake_segments = self.snake_segments[1:]
                 self.tail_y, self.tail_x = self.snake_segments[0]
 
                 self.head_y = new_y
                 self.head_x = new_x
-                self.table[new_y][new_x] = self.HEAD
+                self._set_cell(new_y, new_x, self.HEAD)
 
         elif cell == self.APPLE:
             self.length += 1
             self.snake_segments.append((new_y, new_x))
-            self.table[self.head_y][self.head_x] = self.TAIL
+            self._set_cell(self.head_y, self.head_x, self.TAIL)
             self.head_y = new_y
             self.head_x = new_x
-            self.table[new_y][new_x] = self.HEAD
+            self._set_cell(new_y, new_x, self.HEAD)
 
             if self.apple_1 == (new_y, new_x):
                 self.apple_1 = self.set_cell_to_random_empty(self.APPLE)
@@ -154,30 +204,30 @@ class init_board:
             self.snake_segments.append((new_y, new_x))
 
             tmp_y, tmp_x = self.snake_segments[0]
-            self.table[tmp_y][tmp_x] = self.EMPTY
+            self._set_cell(tmp_y, tmp_x, self.EMPTY)
             self.snake_segments = self.snake_segments[1:]
             tmp_y, tmp_x = self.snake_segments[0]
-            self.table[tmp_y][tmp_x] = self.EMPTY
+            self._set_cell(tmp_y, tmp_x, self.EMPTY)
             self.snake_segments = self.snake_segments[1:]
             self.tail_y, self.tail_x = self.snake_segments[0]
 
             if (self.length > 1):
-                self.table[self.head_y][self.head_x] = self.TAIL
+                self._set_cell(self.head_y, self.head_x, self.TAIL)
             self.head_y = new_y
             self.head_x = new_x
-            self.table[new_y][new_x] = self.HEAD
+            self._set_cell(new_y, new_x, self.HEAD)
             self.set_cell_to_random_empty(self.PEPPER)
 
         elif cell == self.EMPTY:
             self.snake_segments.append((new_y, new_x))
-            self.table[self.head_y][self.head_x] = self.TAIL
-            self.table[self.tail_y][self.tail_x] = self.EMPTY
+            self._set_cell(self.head_y, self.head_x, self.TAIL)
+            self._set_cell(self.tail_y, self.tail_x, self.EMPTY)
             self.snake_segments = self.snake_segments[1:]
             self.tail_y, self.tail_x = self.snake_segments[0]
 
             self.head_y = new_y
             self.head_x = new_x
-            self.table[new_y][new_x] = self.HEAD
+            self._set_cell(new_y, new_x, self.HEAD)
 
         self.moving_dir = action
 
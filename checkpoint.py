@@ -0,0 +1,177 @@
+import os
+import queue
+import threading
+from datetime import datetime
+import numpy as np
+
+CHECKPOINT_FORMATS = ('keras', 'npz')
+EXTENSIONS = {'keras': 'keras', 'npz': 'npz', 'q_table': 'npz'}
+
+
+def create_model_folder(name):
+    """Make models/<name>, or models/<name>2, 3, ... if it is taken, and
+    return the folder name used"""
+    base_path = os.path.join("models", name)
+    folder_name = name
+    if os.path.exists(base_path) and os.path.isdir(base_path):
+        i = 2
+        while (os.path.exists(f"{base_path}{i}") and
+               os.path.isdir(f"{base_path}{i}")):
+            i += 1
+        folder_name = f"{name}{i}"
+    os.makedirs("models", exist_ok=True)
+    os.makedirs(os.path.join("models", folder_name), exist_ok=True)
+    return folder_name
+
+
+def save_npz_checkpoint(path, weights, activations, metadata):
+    """Weights-only checkpoint: one uncompressed .npz, no TensorFlow.
+
+    Holds the Dense kernels and biases as w0, w1, ..., the activation of
+    every layer, the layer sizes and metadata such as epsilon, the board
+    size and the state encoder name.
+    """
+    arrays = {f"w{i}": np.asarray(w, dtype=np.float32)
+              for i, w in enumerate(weights)}
+    layer_sizes = [arrays['w0'].shape[0]] + [
+        arrays[f"w{i}"].shape[1] for i in range(0, len(weights), 2)
+    ]
+    with open(path, 'wb') as file:
+        np.savez(
+            file, **arrays,
+            activations=np.array(activations),
+            layer_sizes=np.array(layer_sizes, dtype=np.int64),
+            meta_keys=np.array(list(metadata), dtype=str),
+            meta_values=np.array([str(v) for v in metadata.values()]),
+        )
+
+
+def load_npz_checkpoint(path):
+    """(weights, activations, metadata) of a save_npz_checkpoint file"""
+    with np.load(path) as data:
+        activations = [str(a) for a in data['activations']]
+        weights = [data[f"w{i}"] for i in range(2 * len(activations))]
+        metadata = dict(zip((str(k) for k in data['meta_keys']),
+                            (str(v) for v in data['meta_values'])))
+    return weights, activations, metadata
+
+
+def warn_map_size(metadata, encoder, board):
+    """Warn when a checkpoint's distance features were scaled for a map
+    of another max(height, width) than board"""
+    if not encoder.distance_columns or 'map_height' not in metadata:
+        return
+    height = int(metadata['map_height'])
+    width = int(metadata['map_width'])
+    if max(height, width) != max(board.size_y, board.size_x):
+        print(f"Warning: checkpoint trained on a {width}x{height} map, "
+              f"its distance features are scaled differently on "
+              f"{board.size_x}x{board.size_y}")
+
+
+def save_q_table(path, codes, q_values, metadata):
+    """Tabular agent checkpoint: the visited rows of the Q table only"""
+    with open(path, 'wb') as file:
+        np.savez(
+            file,
+            q_codes=np.asarray(codes, dtype=np.int64),
+            q_values=np.asarray(q_values, dtype=np.float32),
+            meta_keys=np.array(list(metadata), dtype=str),
+            meta_values=np.array([str(v) for v in metadata.values()]),
+        )
+
+
+def load_q_table(path):
+    """(codes, q_values, metadata) of a save_q_table file"""
+    with np.load(path) as data:
+        codes = data['q_codes']
+        q_values = data['q_values']
+        metadata = dict(zip((str(k) for k in data['meta_keys']),
+                            (str(v) for v in data['meta_values'])))
+    return codes, q_values, metadata
+
+
+class CheckpointWriter:
+    """Saves weight snapshots on a background thread.
+
+    save only queues a copy of the weights, so the training loop never
+    waits on disk. In 'keras' format the snapshot goes through a scratch
+    model, in 'npz' format it is written with save_npz_checkpoint and in
+    'q_table' format the snapshot is (codes, q_values) for save_q_table.
+    After each write the retention policy keeps the last keep_last
+    checkpoints, the best one by evaluation and every keep_every-th
+    episode (0 keeps no history), and removes the rest of the files this
+    writer created.
+    """
+
+    def __init__(self, folder, model, keep_last=5, keep_every=100,
+                 checkpoint_format='keras', activations=None):
+        self.folder = folder
+        self.model = model  # scratch model the snapshots are loaded into
+        self.checkpoint_format = checkpoint_format
+        self.activations = activations
+        self.keep_last = max(1, keep_last)
+        self.keep_every = keep_every
+        self.saved = {}  # path -> episode, in write order
+        self.best_episode = None
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def save(self, episode, weights, metadata=None):
+        self.queue.put((episode, weights, metadata or {}))
+
+    def mark_best(self, episode):
+        self.queue.put(('best', episode))
+
+    def close(self):
+        """Wait for the pending writes"""
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if item[0] == 'best':
+                self.best_episode = item[1]
+                continue
+            try:
+                self._write(*item)
+                self._apply_retention()
+            except Exception as e:
+                print(f"\033[91mFailed to save model: {e}\033[0m")
+
+    def _write(self, episode, weights, metadata):
+        timestamp = datetime.now().strftime("%Y%m%d_%H:%M")
+        model_path = os.path.join(
+            self.folder,
+            f"snake_model_{episode}_{timestamp}."
+            f"{EXTENSIONS[self.checkpoint_format]}"
+        )
+        if self.checkpoint_format == 'npz':
+            save_npz_checkpoint(model_path, weights, self.activations,
+                                metadata)
+        elif self.checkpoint_format == 'q_table':
+            save_q_table(model_path, *weights, metadata)
+        else:
+            self.model.set_weights(weights)
+            self.model.save(model_path)
+        self.saved.pop(model_path, None)
+        self.saved[model_path] = episode
+        print(f"Model saved to {model_path}")
+
+    def _apply_retention(self):
+        paths = list(self.saved)
+        keep = set(paths[-self.keep_last:])
+        for path, episode in self.saved.items():
+            if episode == self.best_episode or (
+                    self.keep_every and episode % self.keep_every == 0):
+                keep.add(path)
+
+        for path in paths:
+            if path not in keep:
+                del self.saved[path]
+                if os.path.exists(path):
+                    os.remove(path)
@@ -0,0 +1,37 @@
+import argparse
+from board import init_board
+from agent import SnakeAgent
+from checkpoint import save_npz_checkpoint
+from get_state import STATE_ENCODERS
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert a model between .keras and .npz checkpoints")
+    parser.add_argument('source', help='.keras or .npz file to read')
+    parser.add_argument('destination', help='.npz or .keras file to write')
+    parser.add_argument('--map_width', '-mw', type=int, default=10,
+                        help='Board width stored in the .npz metadata')
+    parser.add_argument('--map_height', '-mh', type=int, default=10,
+                        help='Board height stored in the .npz metadata')
+    parser.add_argument('--state_encoder', '-se', default='12_normalized',
+                        choices=STATE_ENCODERS,
+                        help='State encoding a .keras source was trained '
+                             'on (a .npz source records its own)')
+    args = parser.parse_args()
+
+    agent = SnakeAgent(init_board(args.map_height, args.map_width),
+                       state_encoder=args.state_encoder)
+    agent.load_model(args.source)
+
+    if args.destination.endswith('.npz'):
+        save_npz_checkpoint(args.destination, agent.model.get_weights(),
+                            agent.policy.activations,
+                            agent.checkpoint_metadata())
+    else:
+        agent.model.save(args.destination)
+    print(f"Model saved to {args.destination}")
+
+
+if __name__ == "__main__":
+    main()
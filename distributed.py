@@ -0,0 +1,457 @@
+import os
+import time
+import queue
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from replay_buffer import ReplayBuffer, NStepAccumulator
+from inference import NumpyPolicy, PolicyAgent
+from parallel_evaluation import _make_board, _seed_everything
+
+# layout of SharedPolicy.header
+VERSION = 0  # odd while the learner is writing the weights
+EPSILON = 1
+STOP = 2
+HEADER_SIZE = 3
+
+# layout of a SharedReplayBuffer.cursors row
+POSITION = 0  # next row the actor writes
+SIZE = 1
+SEQUENCE = 2  # two per append, odd while the actor writes a row
+CURSOR_SIZE = 3
+
+
+def _shared_array(shape, dtype, name=None):
+    """(array, SharedMemory) pair, created when name is None"""
+    dtype = np.dtype(dtype)
+    size = max(1, int(np.prod(shape)) * dtype.itemsize)
+    if name is None:
+        shm = shared_memory.SharedMemory(create=True, size=size)
+    else:
+        shm = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    if name is None:
+        array.fill(0)
+    return array, shm
+
+
+class SharedReplayBuffer(ReplayBuffer):
+    """Replay memory in multiprocessing.shared_memory, one slice per actor.
+
+    Every actor appends to its own partition (see partition), so writers
+    never contend. The learner samples uniformly over everything stored
+    in all partitions. Build it in the learner, pass spec() to the actor
+    processes and rebuild it there with names=spec.
+
+    Actors overwrite their ring while the learner reads, so sampling
+    leaves out the fence_rows rows ahead of each write cursor, and
+    gather checks the partition sequence numbers afterwards: if an actor
+    wrote past that window meanwhile, the batch is drawn again.
+    """
+
+    def __init__(self, partition_capacity, state_size, actors, names=None,
+                 codec=None, fence_rows=64):
+        self.partition_capacity = partition_capacity
+        self.actors = actors
+        self.fence_rows = min(fence_rows, partition_capacity // 2)
+        self._snapshot = None
+        self._names = names
+        self._owner = names is None
+        self._shm = {}
+        super().__init__(partition_capacity * actors, state_size, codec)
+        self.cursors = self._allocate('cursors', (actors, CURSOR_SIZE),
+                                      np.int64)
+
+    def _allocate(self, name, shape, dtype):
+        shm_name = None if self._owner else self._names[name]
+        array, shm = _shared_array(shape, dtype, shm_name)
+        self._shm[name] = shm
+        return array
+
+    def spec(self):
+        return {name: shm.name for name, shm in self._shm.items()}
+
+    def partition(self, actor):
+        return _ReplayPartition(self, actor)
+
+    def __len__(self):
+        return int(self.cursors[:, SIZE].sum())
+
+    def sample_indices(self, batch_size):
+        """Uniform draw over the stored rows outside the write fences"""
+        capacity = self.partition_capacity
+        # sequence first: rows finished after it are final once seen
+        sequences = self.cursors[:, SEQUENCE].copy()
+        positions = self.cursors[:, POSITION].copy()
+        sizes = self.cursors[:, SIZE].copy()
+        self._snapshot = sequences
+
+        # stored rows among the fence_rows rows from the write position
+        fenced = np.where(sizes == capacity, self.fence_rows,
+                          np.maximum(0, sizes + self.fence_rows - capacity))
+        fenced = np.minimum(fenced, sizes)
+        safe = sizes - fenced
+        starts = np.where(sizes == capacity,
+                          (positions + self.fence_rows) % capacity, fenced)
+
+        ends = np.cumsum(safe)
+        draws = np.random.randint(0, max(1, ends[-1]), size=batch_size)
+        parts = np.searchsorted(ends, draws, side='right')
+        parts = np.minimum(parts, self.actors - 1)
+        offsets = draws - (ends[parts] - safe[parts])
+        rows = (starts[parts] + offsets) % capacity
+        return parts * capacity + rows
+
+    def gather(self, indices, out=None):
+        """ReplayBuffer.gather of indices from sample_indices.
+
+        When an actor went past its fence during the copy, indices is
+        drawn again in place and the batch gathered again.
+        """
+        while True:
+            snapshot = self._snapshot
+            out = super().gather(indices, out)
+            if snapshot is None:
+                return out
+            # rows touched since the snapshot, the one being written too
+            started = ((self.cursors[:, SEQUENCE] + 1) // 2
+                       - snapshot // 2)
+            if np.all(started <= self.fence_rows):
+                return out
+            indices[:] = self.sample_indices(len(indices))
+
+    def append(self, state, action, reward, next_state, done, horizon=1):
+        raise RuntimeError("Append through partition(actor) instead")
+
+    def close(self):
+        """Drop the arrays, then the shared blocks (unlinked by the owner).
+
+        Partitions hold views of these arrays, drop them first.
+        """
+        for name in self._shm:
+            setattr(self, name, None)
+        for shm in self._shm.values():
+            shm.close()
+            if self._owner:
+                shm.unlink()
+
+
+class _ReplayPartition(ReplayBuffer):
+    """One actor's slice of a SharedReplayBuffer, written as a ring"""
+
+    def __init__(self, parent, actor):
+        self.parent = parent
+        self.actor = actor
+        start = actor * parent.partition_capacity
+        self._rows = slice(start, start + parent.partition_capacity)
+        super().__init__(parent.partition_capacity, parent.state_size,
+                         parent.codec)
+
+    def _allocate(self, name, shape, dtype):
+        return getattr(self.parent, name)[self._rows]
+
+    def append(self, state, action, reward, next_state, done, horizon=1):
+        cursor = self.parent.cursors[self.actor]
+        cursor[SEQUENCE] += 1
+        super().append(state, action, reward, next_state, done, horizon)
+        cursor[SEQUENCE] += 1
+
+    @property
+    def position(self):
+        return int(self.parent.cursors[self.actor, POSITION])
+
+    @position.setter
+    def position(self, value):
+        self.parent.cursors[self.actor, POSITION] = value
+
+    @property
+    def size(self):
+        return int(self.parent.cursors[self.actor, SIZE])
+
+    @size.setter
+    def size(self, value):
+        self.parent.cursors[self.actor, SIZE] = value
+
+
+class SharedPolicy:
+    """Policy weights and epsilon published by the learner to the actors"""
+
+    def __init__(self, layer_shapes, names=None):
+        self.layer_shapes = [tuple(shape) for shape in layer_shapes]
+        self._owner = names is None
+        total = sum(int(np.prod(shape)) for shape in self.layer_shapes)
+        self.flat, self._flat_shm = _shared_array(
+            (total,), np.float32, None if self._owner else names[0])
+        self.header, self._header_shm = _shared_array(
+            (HEADER_SIZE,), np.float64, None if self._owner else names[1])
+        self.seen_version = -1
+        self._scratch = np.empty_like(self.flat)
+
+    def spec(self):
+        return (self._flat_shm.name, self._header_shm.name)
+
+    def publish(self, weights, epsilon):
+        self.header[VERSION] += 1
+        offset = 0
+        for array in weights:
+            self.flat[offset:offset + array.size] = array.ravel()
+            offset += array.size
+        self.header[EPSILON] = epsilon
+        self.header[VERSION] += 1
+
+    def refresh(self, policy):
+        """Copy newer weights into a NumpyPolicy, True if it changed.
+
+        The weights are copied to a private buffer first and only reach
+        the policy if no publish started meanwhile.
+        """
+        version = self.header[VERSION]
+        if version == self.seen_version or version % 2:
+            return False
+        np.copyto(self._scratch, self.flat)
+        if self.header[VERSION] != version:  # torn read, retry next time
+            return False
+        offset = 0
+        weights = []
+        for shape in self.layer_shapes:
+            size = int(np.prod(shape))
+            weights.append(self._scratch[offset:offset + size].reshape(shape))
+            offset += size
+        policy.set_weights(weights)
+        self.seen_version = version
+        return True
+
+    @property
+    def epsilon(self):
+        return float(self.header[EPSILON])
+
+    @property
+    def stopped(self):
+        return bool(self.header[STOP])
+
+    def stop(self):
+        self.header[STOP] = 1
+
+    def close(self):
+        self.flat = None
+        self.header = None
+        self._scratch = None
+        for shm in (self._flat_shm, self._header_shm):
+            shm.close()
+            if self._owner:
+                shm.unlink()
+
+
+def run_actor(actor, replay_spec, policy_spec, settings, episode_queue):
+    """Actor process: play episodes and write transitions to its slice"""
+    from training import calculate_reward
+    from warmup import warm_up_kernels
+
+    warm_up_kernels()
+    _seed_everything(settings['board_engine'], settings['seed'])
+    memory = SharedReplayBuffer(
+        settings['partition_capacity'], settings['state_size'],
+        settings['actors'], names=replay_spec, codec=settings['codec']
+    )
+    partition = memory.partition(actor)
+    writer = partition
+    if settings['n_step'] > 1:
+        writer = NStepAccumulator(partition, settings['n_step'],
+                                  settings['gamma'])
+    shared_policy = SharedPolicy(settings['layer_shapes'], names=policy_spec)
+    policy = NumpyPolicy(
+        [np.zeros(shape, dtype=np.float32)
+         for shape in settings['layer_shapes']],
+        settings['activations']
+    )
+    board = _make_board(settings['board_engine'], settings['map_height'],
+                        settings['map_width'])
+    agent = PolicyAgent(board, policy, settings['state_encoder'])
+    refresh_interval = settings['refresh_interval']
+    max_steps = 100
+
+    try:
+        steps_since_refresh = refresh_interval
+        while not shared_policy.stopped:
+            state = agent.get_state()
+            total_reward = 0
+            done = False
+            max_length = 3
+            steps = 0
+            steps_no_food = 0
+
+            while not done and steps_no_food < max_steps:
+                if steps_since_refresh >= refresh_interval:
+                    shared_policy.refresh(policy)
+                    agent.epsilon = shared_policy.epsilon
+                    steps_since_refresh = 0
+                steps_since_refresh += 1
+
+                action = agent.get_action(state)
+                old_length = board.length
+                done = board.make_move(action)
+
+                reward = calculate_reward(board, old_length, done)
+                total_reward += reward
+
+                if board.length > old_length:
+                    steps_no_food = 0
+                    max_length = max(board.length, max_length)
+
+                next_state = agent.get_state()
+                writer.append(state, action, reward, next_state, done)
+                state = next_state
+
+                steps += 1
+                steps_no_food += 1
+
+            if writer is not partition:
+                writer.flush()
+            episode_queue.put((actor, total_reward, max_length, steps))
+            board.reset()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        partition = writer = None
+        memory.close()
+        shared_policy.close()
+
+
+def run_distributed_training(agent, board, args):
+    """Actors fill a shared replay memory, this process only learns.
+
+    Logging, checkpoints, periodic evaluation and --profile follow
+    run_training, counting the episodes finished by all actors together.
+    A profile row covers the time between two finished episodes.
+    """
+    from training import periodic_evaluation, create_evaluator
+
+    actors = args.actors
+    memory = SharedReplayBuffer(
+        max(1, args.memory_size // actors), agent.INPUT_SIZE, actors,
+        codec=agent.codec)
+    agent.memory = memory
+    weights = agent.model.get_weights()
+    shared_policy = SharedPolicy([w.shape for w in weights])
+    shared_policy.publish(weights, agent.epsilon)
+
+    agent.set_folder_name(args.name)
+    log_file = open(os.path.join("models", agent.folder_name, 'logs.txt'),
+                    'a')
+    eval_file = open(
+        os.path.join("models", agent.folder_name, 'evaluation.txt'), 'a')
+
+    profiler = None
+    if args.profile:
+        from profiler import PhaseTimer
+        profiler = PhaseTimer(
+            os.path.join("models", agent.folder_name, 'profile.txt'))
+        agent.profiler = profiler
+        profiler.begin_episode(agent.updates)
+    evaluator = create_evaluator(agent, board, args)
+
+    context = multiprocessing.get_context('spawn')
+    episode_queue = context.Queue()
+    seeds = np.random.SeedSequence().spawn(actors)
+    settings = {
+        'partition_capacity': memory.partition_capacity,
+        'state_size': agent.INPUT_SIZE,
+        'n_step': agent.n_step,
+        'gamma': agent.GAMMA,
+        'codec': agent.codec,
+        'state_encoder': agent.state_encoder,
+        'actors': actors,
+        'layer_shapes': shared_policy.layer_shapes,
+        'activations': agent.policy.activations,
+        'board_engine': args.board_engine,
+        'map_height': board.size_y,
+        'map_width': board.size_x,
+        'refresh_interval': args.actor_refresh_interval,
+    }
+    processes = [
+        context.Process(
+            target=run_actor,
+            args=(i, memory.spec(), shared_policy.spec(),
+                  dict(settings, seed=int(seeds[i].generate_state(1)[0])),
+                  episode_queue),
+            daemon=True
+        )
+        for i in range(actors)
+    ]
+    for process in processes:
+        process.start()
+
+    episodes = max(2, args.episodes + 1)
+    save_frequency = 10
+    best_avg_length = 0
+    poor_performance_count = 0
+    updates = 0
+    episode = 0
+    stop = False
+
+    try:
+        while not stop and episode < episodes - 1:
+            if profiler:
+                profiler.start()
+            if len(memory) < agent.BATCH_SIZE:
+                time.sleep(0.01)
+            else:
+                agent.replay(agent.BATCH_SIZE)
+                updates += 1
+                if updates % args.actor_refresh_interval == 0:
+                    shared_policy.publish(agent.model.get_weights(),
+                                          agent.epsilon)
+                if profiler:
+                    profiler.lap('train')
+
+            while not stop and episode < episodes - 1:
+                try:
+                    actor, total_reward, max_length, steps = (
+                        episode_queue.get_nowait())
+                except queue.Empty:
+                    break
+                episode += 1
+                log_msg = (
+                    f"{episode} rwrd {total_reward:.1f} len {max_length} "
+                    f"steps {steps} mem {len(agent.memory)}\n"
+                )
+                print(log_msg, end="")
+                log_file.write(log_msg)
+
+                if episode % save_frequency == 0:
+                    if profiler:
+                        profiler.start()
+                    agent.save_model(episode)
+                    log_file.flush()
+                    if profiler:
+                        profiler.lap('checkpoint')
+                    stop, best_avg_length, poor_performance_count = (
+                        periodic_evaluation(
+                            episode, agent, board, 100, eval_file,
+                            best_avg_length, poor_performance_count,
+                            evaluator
+                        )
+                    )
+                    if profiler:
+                        profiler.lap('evaluation')
+                    print()
+                if profiler:
+                    profiler.end_episode(episode, steps, agent.updates)
+                    profiler.begin_episode(agent.updates)
+    finally:
+        shared_policy.stop()
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        if evaluator is not None:
+            evaluator.close()
+        if profiler:
+            profiler.close()
+        log_file.close()
+        eval_file.close()
+        if episode > 0:
+            agent.save_model(episode)
+        agent.close()
+        memory.close()
+        shared_policy.close()
@@ -1,11 +1,12 @@
 import sys
 import signal
-import pygame
 
 
 def run_evaluation(agent, board, graphics, args):
     from training import print_evaluation_summary
-    from ui import handle_ui_events
+    if graphics:
+        import pygame
+        from ui import handle_ui_events
 
     fps = 24
     step_by_step_mode = False
@@ -17,11 +18,31 @@ def run_evaluation(agent, board, graphics, args):
 
     def signal_handler(sig, frame):
         agent.save_model(episode)
+        agent.close()
         print_evaluation_summary(evaluation_lengths)
         sys.exit(0)
 
-    signal.signal(signal.SIGINT, signal_handler)
+    if args.compiled_evaluation and not graphics:
+        from rollout import rollout_games
+        lengths, steps = rollout_games(
+            agent.policy, board.size_y, board.size_x, args.episodes,
+            seed=args.eval_seed, state_encoder=agent.state_encoder
+        )
+        print(f"Average steps per game: {steps.mean():.1f}")
+        print_evaluation_summary(lengths.tolist())
+        return
+
+    if args.policy_table and args.agent == 'dqn':
+        from policy_table import PolicyTable
+        try:
+            agent.policy = PolicyTable.compile(agent.policy, board.size_y,
+                                               board.size_x)
+        except ValueError as e:
+            print(f"\033[91m{e}\033[0m")
+            sys.exit(1)
+        print(f"Policy table of {agent.policy.actions.size} states")
 
+    signal.signal(signal.SIGINT, signal_handler)
     try:
         for episode in range(1, episodes):
             if not running:
@@ -7,9 +7,7 @@ def get_action_dangerous(self, state):
         action = random.randint(0, self.OUTPUT_SIZE - 1)
         self.board.last_move_random = True
     else:
-        state_tensor = np.expand_dims(state, axis=0)
-        q_values = self.model(state_tensor)[0]
-        action = np.argmax(q_values)
+        action = self.policy.greedy_action(state)
         self.board.last_move_random = False
 
     return action
@@ -35,9 +33,7 @@ def get_action_safe(self, state):
             action = random.randint(0, self.OUTPUT_SIZE - 1)
         self.board.last_move_random = True
     else:
-        state_tensor = np.expand_dims(state, axis=0)
-        q_values = self.model(state_tensor)[0]
-        action = np.argmax(q_values)
+        action = self.policy.greedy_action(state)
         self.board.last_move_random = False
 
     return action
@@ -65,9 +61,78 @@ def get_action_half_safe(self, state):
             action = random.randint(0, self.OUTPUT_SIZE - 1)
         self.board.last_move_random = True
     else:
-        state_tensor = np.expand_dims(state, axis=0)
-        q_values = self.model(state_tensor)[0]
-        action = np.argmax(q_values)
+        action = self.policy.greedy_action(state)
         self.board.last_move_random = False
 
     return action
+
+
+# Batched versions: one action per board of an init_vec_board, for a
+# (N, INPUT_SIZE) matrix of states, with a single forward pass.
+
+
+def safe_direction_mask(boards):
+    """(N, 4) mask of the moves that do not kill each snake right away"""
+    new_y = boards.head_y[:, None] + boards.DIRECTIONS_Y[None, :]
+    new_x = boards.head_x[:, None] + boards.DIRECTIONS_X[None, :]
+    inside = ((new_y >= 0) & (new_y < boards.size_y)
+              & (new_x >= 0) & (new_x < boards.size_x))
+    rows = np.arange(boards.num_boards)[:, None]
+    cells = boards.tables[rows,
+                          np.clip(new_y, 0, boards.size_y - 1),
+                          np.clip(new_x, 0, boards.size_x - 1)]
+    on_tail = ((new_y == boards.tail_y[:, None])
+               & (new_x == boards.tail_x[:, None]))
+    return inside & ((cells != boards.TAIL) | on_tail)
+
+
+def _random_actions(mask):
+    """Uniform pick among allowed actions per row, any action if none"""
+    keys = np.random.random(mask.shape)
+    keys[~mask] = -1.0
+    actions = keys.argmax(axis=1)
+    stuck = ~mask.any(axis=1)
+    actions[stuck] = np.random.randint(0, mask.shape[1], stuck.sum())
+    return actions
+
+
+def _explore_mask(self, n):
+    if self.evaluation_mode:
+        return np.zeros(n, dtype=np.bool_)
+    return np.random.rand(n) <= self.epsilon
+
+
+def _greedy_fill(self, states, actions, explore, boards):
+    greedy = ~explore
+    if greedy.any():
+        actions[greedy] = self.policy.greedy_actions(states[greedy])
+    boards.last_move_random[:] = explore
+    return actions
+
+
+def get_actions_dangerous(self, states, boards):
+    explore = _explore_mask(self, len(states))
+    actions = np.zeros(len(states), dtype=np.int64)
+    actions[explore] = np.random.randint(0, self.OUTPUT_SIZE, explore.sum())
+    return _greedy_fill(self, states, actions, explore, boards)
+
+
+def get_actions_safe(self, states, boards):
+    """Batched get_action_safe"""
+    explore = _explore_mask(self, len(states))
+    actions = np.zeros(len(states), dtype=np.int64)
+    if explore.any():
+        safe = safe_direction_mask(boards)[explore]
+        actions[explore] = _random_actions(safe)
+    return _greedy_fill(self, states, actions, explore, boards)
+
+
+def get_actions_half_safe(self, states, boards):
+    explore = _explore_mask(self, len(states))
+    actions = np.zeros(len(states), dtype=np.int64)
+    if explore.any():
+        allowed = safe_direction_mask(boards)[explore]
+        careless = np.random.rand(len(allowed)) > 0.9
+        allowed[careless] = True
+        actions[explore] = _random_actions(allowed)
+    return _greedy_fill(self, states, actions, explore, boards)
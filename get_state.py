@@ -1,6 +1,43 @@
 # here i will have a lot of get_state functions to find out the best
 import numpy as np
 import numba as nb
+from board import init_board
+
+# Compiled kernels are typed up front and cached on disk, so a new
+# process (or pool worker) loads them instead of compiling on first use.
+BOARD_TABLE = nb.int8[:, ::1]
+DIRECTION_TABLE = nb.int8[:, ::1]
+# what the shared fill kernels take, so the DIRECTIONS_ARRAY global fits too
+DIRECTIONS_READONLY = nb.types.Array(nb.int8, 2, 'C', readonly=True)
+STATE_16_SIGNATURE = nb.float32[::1](
+    nb.int64, nb.int64, BOARD_TABLE, nb.int64, nb.int64, DIRECTION_TABLE,
+    nb.int64, nb.int64, nb.int64, nb.int64, nb.int64
+)
+STATE_12_SIGNATURE = nb.float32[::1](
+    nb.int64, nb.int64, BOARD_TABLE, DIRECTION_TABLE,
+    nb.int64, nb.int64, nb.int64, nb.int64
+)
+BITBOARDS = nb.int64[:, ::1]
+RAY_SIGNATURE = nb.types.UniTuple(nb.int64, 3)(
+    BITBOARDS, nb.int64, nb.int64, nb.int64, nb.int64, nb.int64, nb.int64
+)
+BITBOARD_SIGNATURE = nb.float32[::1](
+    nb.int64, nb.int64, BITBOARDS, nb.int64, nb.int64
+)
+BITBOARD_FILL_SIGNATURE = nb.void(
+    nb.int64, nb.int64, BITBOARDS, nb.int64, nb.int64, nb.float32[::1]
+)
+POSITIONS = nb.int64[::1]
+BATCH_SIGNATURE = nb.void(
+    POSITIONS, POSITIONS, POSITIONS, POSITIONS, nb.int8[:, :, ::1],
+    nb.float32[:, ::1]
+)
+
+# the encoders take this instead of building it from board.DIRECTIONS
+DIRECTIONS_ARRAY = np.array(init_board.DIRECTIONS, dtype=np.int8)
+TAIL = init_board.TAIL
+APPLE = init_board.APPLE
+PEPPER = init_board.PEPPER
 
 
 def get_state_16bits(self):
@@ -56,12 +93,12 @@ def get_state_16bits(self):
     return state
 
 
-@nb.njit
-def get_state_16_normalized_numba(head_y, head_x,
-                                  table, tail_y, tail_x,
-                                  directions, TAIL, APPLE,
-                                  PEPPER, SIZE_Y, SIZE_X):
-    state = np.zeros(16, dtype=np.float32)
+@nb.njit(nb.void(nb.int64, nb.int64, BOARD_TABLE, DIRECTIONS_READONLY,
+                 nb.int64, nb.int64, nb.int64, nb.int64, nb.int64,
+                 nb.float32[::1]), cache=True)
+def _fill_state_16(head_y, head_x, table, directions, TAIL, APPLE, PEPPER,
+                   SIZE_Y, SIZE_X, state):
+    state[:] = 0
 
     MAX_DISTANCE = max(SIZE_Y, SIZE_X)
     SIZE_INV = 1.0 / MAX_DISTANCE
@@ -94,13 +131,24 @@ def get_state_16_normalized_numba(head_y, head_x,
 
         state[base_idx + 3] = dist * SIZE_INV
 
+
+@nb.njit(STATE_16_SIGNATURE, cache=True)
+def get_state_16_normalized_numba(head_y, head_x,
+                                  table, tail_y, tail_x,
+                                  directions, TAIL, APPLE,
+                                  PEPPER, SIZE_Y, SIZE_X):
+    state = np.empty(16, dtype=np.float32)
+    _fill_state_16(head_y, head_x, table, directions, TAIL, APPLE, PEPPER,
+                   SIZE_Y, SIZE_X, state)
     return state
 
 
-@nb.njit
-def get_state_12_normalized_numba(head_y, head_x, table, directions,
-                                  TAIL, APPLE, SIZE_Y, SIZE_X):
-    state = np.zeros(12, dtype=np.float32)
+@nb.njit(nb.void(nb.int64, nb.int64, BOARD_TABLE, DIRECTIONS_READONLY,
+                 nb.int64, nb.int64, nb.int64, nb.int64, nb.float32[::1]),
+         cache=True)
+def _fill_state_12(head_y, head_x, table, directions, TAIL, APPLE,
+                   SIZE_Y, SIZE_X, state):
+    state[:] = 0
 
     MAX_DISTANCE = max(SIZE_Y, SIZE_X)
     SIZE_INV = 1.0 / MAX_DISTANCE
@@ -131,4 +179,247 @@ def get_state_12_normalized_numba(head_y, head_x, table, directions,
 
         state[base_idx + 2] = dist * SIZE_INV
 
+
+@nb.njit(STATE_12_SIGNATURE, cache=True)
+def get_state_12_normalized_numba(head_y, head_x, table, directions,
+                                  TAIL, APPLE, SIZE_Y, SIZE_X):
+    state = np.empty(12, dtype=np.float32)
+    _fill_state_12(head_y, head_x, table, directions, TAIL, APPLE,
+                   SIZE_Y, SIZE_X, state)
+    return state
+
+
+@nb.njit(nb.void(nb.int64, nb.int64, BOARD_TABLE, nb.int64, nb.int64,
+                 nb.float32[::1]), cache=True)
+def _fill_state_16bits(head_y, head_x, table, tail_y, tail_x, state):
+    """Compiled get_state_16bits, on the size of the given table"""
+    state[:] = 0
+    SIZE_Y, SIZE_X = table.shape
+
+    for i in range(4):
+        dy = DIRECTIONS_ARRAY[i, 0]
+        dx = DIRECTIONS_ARRAY[i, 1]
+        base_idx = i * 4
+
+        next_y = head_y + dy
+        next_x = head_x + dx
+        if 0 <= next_y < SIZE_Y and 0 <= next_x < SIZE_X:
+            if table[next_y, next_x] != TAIL or (next_y == tail_y
+                                                 and next_x == tail_x):
+                state[base_idx + 3] = 1  # Next cell is free to move
+
+        y = head_y
+        x = head_x
+        while True:
+            y += dy
+            x += dx
+            if not (0 <= y < SIZE_Y and 0 <= x < SIZE_X):
+                state[base_idx + 2] = 1  # Obstacle (wall)
+                break
+
+            cell = table[y, x]
+            if cell == TAIL and (y != tail_y or x != tail_x):
+                state[base_idx + 2] = 1  # Obstacle (tail)
+                break
+            if cell == APPLE:
+                state[base_idx] = 1  # Food
+                break
+            if cell == PEPPER:
+                state[base_idx + 1] = 1  # Pepper
+                break
+
+
+@nb.njit(nb.float32[::1](nb.int64, nb.int64, BOARD_TABLE, nb.int64,
+                         nb.int64), cache=True)
+def get_state_16bits_numba(head_y, head_x, table, tail_y, tail_x):
+    state = np.empty(16, dtype=np.float32)
+    _fill_state_16bits(head_y, head_x, table, tail_y, tail_x, state)
+    return state
+
+
+# Batched encoders: one row of out per board of an (N, H, W) stack, filled
+# in place, boards spread over all cores. They all take the same arguments
+# so StateEncoder can call any of them.
+
+
+@nb.njit(BATCH_SIGNATURE, parallel=True, cache=True)
+def get_states_16_normalized_batch(head_y, head_x, tail_y, tail_x, tables,
+                                   out):
+    size_y = tables.shape[1]
+    size_x = tables.shape[2]
+    for n in nb.prange(tables.shape[0]):
+        _fill_state_16(head_y[n], head_x[n], tables[n], DIRECTIONS_ARRAY,
+                       TAIL, APPLE, PEPPER, size_y, size_x, out[n])
+
+
+@nb.njit(BATCH_SIGNATURE, parallel=True, cache=True)
+def get_states_12_normalized_batch(head_y, head_x, tail_y, tail_x, tables,
+                                   out):
+    size_y = tables.shape[1]
+    size_x = tables.shape[2]
+    for n in nb.prange(tables.shape[0]):
+        _fill_state_12(head_y[n], head_x[n], tables[n], DIRECTIONS_ARRAY,
+                       TAIL, APPLE, size_y, size_x, out[n])
+
+
+@nb.njit(BATCH_SIGNATURE, parallel=True, cache=True)
+def get_states_16bits_batch(head_y, head_x, tail_y, tail_x, tables, out):
+    for n in nb.prange(tables.shape[0]):
+        _fill_state_16bits(head_y[n], head_x[n], tables[n], tail_y[n],
+                           tail_x[n], out[n])
+
+
+@nb.njit(nb.int64(nb.int64), cache=True)
+def _lowest_bit(mask):
+    return int(np.log2(mask & -mask))  # a power of two, exact in float
+
+
+@nb.njit(nb.int64(nb.int64), cache=True)
+def _highest_bit(mask):
+    bit = int(np.log2(mask))
+    if (1 << bit) > mask:  # float rounding up just below a power of two
+        bit -= 1
+    return bit
+
+
+@nb.njit(RAY_SIGNATURE, cache=True)
+def _cast_ray(bitboards, head_y, head_x, direction, values, SIZE_Y, SIZE_X):
+    """(line, bit, distance) of the first cell a ray from the head hits.
+
+    values is a bitmask of the cell values that stop the ray. line and
+    bit locate the hit in bitboards, bit is -1 when the ray reaches the
+    wall. Directions follow init_board.DIRECTIONS.
+    """
+    if direction == 0 or direction == 2:  # LEFT, RIGHT: scan the row
+        line = head_y
+        pos = head_x
+        size = SIZE_X
+    else:  # UP, DOWN: scan the column
+        line = SIZE_Y + head_x
+        pos = head_y
+        size = SIZE_Y
+
+    occupied = 0
+    for value in range(bitboards.shape[0]):
+        if values & (1 << value):
+            occupied |= bitboards[value, line]
+
+    if direction < 2:  # towards bit 0
+        ahead = occupied & ((1 << pos) - 1)
+        if ahead == 0:
+            return line, -1, pos
+        bit = _highest_bit(ahead)
+        return line, bit, pos - bit - 1
+
+    ahead = occupied & ~((2 << pos) - 1)
+    if ahead == 0:
+        return line, -1, size - pos - 1
+    bit = _lowest_bit(ahead)
+    return line, bit, bit - pos - 1
+
+
+@nb.njit(BITBOARD_FILL_SIGNATURE, cache=True)
+def _fill_state_16_bitboard(head_y, head_x, bitboards, SIZE_Y, SIZE_X,
+                            state):
+    state[:] = 0
+    SIZE_INV = 1.0 / max(SIZE_Y, SIZE_X)
+    values = (1 << TAIL) | (1 << APPLE) | (1 << PEPPER)
+
+    for i in range(4):
+        line, bit, dist = _cast_ray(bitboards, head_y, head_x, i, values,
+                                    SIZE_Y, SIZE_X)
+        base_idx = i * 4
+        if bit < 0 or (bitboards[TAIL, line] >> bit) & 1:
+            state[base_idx] = 1
+        elif (bitboards[APPLE, line] >> bit) & 1:
+            state[base_idx + 1] = 1
+        else:
+            state[base_idx + 2] = 1
+        state[base_idx + 3] = dist * SIZE_INV
+
+
+@nb.njit(BITBOARD_SIGNATURE, cache=True)
+def get_state_16_bitboard_numba(head_y, head_x, bitboards, SIZE_Y, SIZE_X):
+    """Same output as get_state_16_normalized_numba, from the bitboards"""
+    state = np.empty(16, dtype=np.float32)
+    _fill_state_16_bitboard(head_y, head_x, bitboards, SIZE_Y, SIZE_X, state)
+    return state
+
+
+@nb.njit(BITBOARD_FILL_SIGNATURE, cache=True)
+def _fill_state_12_bitboard(head_y, head_x, bitboards, SIZE_Y, SIZE_X,
+                            state):
+    state[:] = 0
+    SIZE_INV = 1.0 / max(SIZE_Y, SIZE_X)
+    values = (1 << TAIL) | (1 << APPLE)
+
+    for i in range(4):
+        line, bit, dist = _cast_ray(bitboards, head_y, head_x, i, values,
+                                    SIZE_Y, SIZE_X)
+        base_idx = i * 3
+        if bit < 0 or (bitboards[TAIL, line] >> bit) & 1:
+            state[base_idx] = 1  # wall or tail
+        else:
+            state[base_idx + 1] = 1  # apple
+        state[base_idx + 2] = dist * SIZE_INV
+
+
+@nb.njit(BITBOARD_SIGNATURE, cache=True)
+def get_state_12_bitboard_numba(head_y, head_x, bitboards, SIZE_Y, SIZE_X):
+    """Same output as get_state_12_normalized_numba, from the bitboards"""
+    state = np.empty(12, dtype=np.float32)
+    _fill_state_12_bitboard(head_y, head_x, bitboards, SIZE_Y, SIZE_X, state)
     return state
+
+
+class StateEncoder:
+    """A state encoding by name: its size, one board, a stack of boards.
+
+    encode takes an init_board or init_numba_board, encode_batch takes an
+    init_vec_board and an optional (N, size) float32 buffer to fill.
+    distance_columns are the features holding a distance over
+    max(height, width), every other feature is 0 or 1.
+    """
+
+    def __init__(self, name, size, encode, batch_kernel,
+                 distance_columns=()):
+        self.name = name
+        self.size = size
+        self.encode = encode
+        self.batch_kernel = batch_kernel
+        self.distance_columns = distance_columns
+
+    def encode_batch(self, boards, out=None):
+        if out is None:
+            out = np.empty((boards.num_boards, self.size), dtype=np.float32)
+        self.batch_kernel(boards.head_y, boards.head_x, boards.tail_y,
+                          boards.tail_x, boards.tables, out)
+        return out
+
+
+def _encode_12_normalized(board):
+    return get_state_12_bitboard_numba(board.head_y, board.head_x,
+                                       board.bitboards, board.size_y,
+                                       board.size_x)
+
+
+def _encode_16_normalized(board):
+    return get_state_16_bitboard_numba(board.head_y, board.head_x,
+                                       board.bitboards, board.size_y,
+                                       board.size_x)
+
+
+def _encode_16bits(board):
+    return get_state_16bits_numba(board.head_y, board.head_x, board.table,
+                                  board.tail_y, board.tail_x)
+
+
+STATE_ENCODERS = {
+    encoder.name: encoder for encoder in (
+        StateEncoder('12_normalized', 12, _encode_12_normalized,
+                     get_states_12_normalized_batch, (2, 5, 8, 11)),
+        StateEncoder('16_normalized', 16, _encode_16_normalized,
+                     get_states_16_normalized_batch, (3, 7, 11, 15)),
+        StateEncoder('16bits', 16, _encode_16bits, get_states_16bits_batch),
+    )
+}
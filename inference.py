@@ -0,0 +1,108 @@
+import os
+import sys
+import numpy as np
+from checkpoint import load_npz_checkpoint, warn_map_size
+from get_state import STATE_ENCODERS
+from get_action import get_action_safe
+
+
+class NumpyPolicy:
+    """Forward pass of a stack of Dense layers in plain NumPy.
+
+    Holds copies of the kernels and biases, so Q values for a single
+    state cost a few small matrix products instead of a framework call.
+    Nothing here imports TensorFlow.
+    """
+    ACTIVATIONS = ('relu', 'linear')
+
+    def __init__(self, weights, activations):
+        if len(weights) != 2 * len(activations):
+            raise ValueError("Expected a kernel and a bias per layer")
+        for activation in activations:
+            if activation not in self.ACTIVATIONS:
+                raise ValueError(f"Unsupported activation: {activation}")
+        self.activations = list(activations)
+        self.weights = [np.array(w, dtype=np.float32) for w in weights]
+
+    @classmethod
+    def from_keras(cls, model):
+        weights = []
+        activations = []
+        for layer in model.layers:
+            weights.extend(layer.get_weights())
+            activations.append(layer.activation.__name__)
+        return cls(weights, activations)
+
+    @classmethod
+    def from_checkpoint(cls, path):
+        """Policy from a .npz checkpoint, without TensorFlow"""
+        weights, activations, _ = load_npz_checkpoint(path)
+        return cls(weights, activations)
+
+    @property
+    def layer_sizes(self):
+        return [self.weights[0].shape[0]] + [
+            kernel.shape[1] for kernel in self.weights[::2]
+        ]
+
+    def set_weights(self, weights):
+        for dest, source in zip(self.weights, weights):
+            dest[...] = source
+
+    def q_values(self, states):
+        """Q values for one state vector or a (N, INPUT_SIZE) matrix"""
+        out = np.asarray(states, dtype=np.float32)
+        for i, activation in enumerate(self.activations):
+            out = out @ self.weights[2 * i]
+            out += self.weights[2 * i + 1]
+            if activation == 'relu':
+                np.maximum(out, 0.0, out=out)
+        return out
+
+    def greedy_action(self, state):
+        return np.argmax(self.q_values(state))
+
+    def greedy_actions(self, states):
+        return np.argmax(self.q_values(states), axis=1)
+
+
+class PolicyAgent:
+    """Acting-only agent around a NumpyPolicy, never imports TensorFlow.
+
+    Has what get_action_safe, run_evaluation and the actor processes
+    need from SnakeAgent; it does not learn.
+    """
+    OUTPUT_SIZE = 4
+
+    def __init__(self, board, policy=None, state_encoder='12_normalized'):
+        self.board = board
+        self.policy = policy
+        self.state_encoder = state_encoder
+        self.encoder = STATE_ENCODERS[state_encoder]
+        self.epsilon = 1.0
+        self.evaluation_mode = False
+
+    def get_state(self):
+        return self.encoder.encode(self.board)
+
+    def get_action(self, state):
+        return get_action_safe(self, state)
+
+    def load_model(self, model_path):
+        if not (os.path.exists(model_path) and model_path.endswith('.npz')):
+            print("\033[91mFailed to load model\033[0m")
+            sys.exit(1)
+        weights, activations, metadata = load_npz_checkpoint(model_path)
+        self.policy = NumpyPolicy(weights, activations)
+        # the checkpoint knows which encoding its network was trained on
+        self.state_encoder = metadata.get('state_encoder',
+                                          self.state_encoder)
+        self.encoder = STATE_ENCODERS[self.state_encoder]
+        warn_map_size(metadata, self.encoder, self.board)
+        self.epsilon = 0.1
+
+    def save_model(self, episode):
+        pass  # nothing learned, nothing to save
+
+    def close(self):
+        pass
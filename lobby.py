@@ -113,6 +113,7 @@ def run_lobby():
     vision_toggle = Toggle(450, 340, " Print State:", False)
 
     history_toggle = Toggle(250, 370, "Show History:", False)
+    tabular_toggle = Toggle(450, 370, " Tabular Q:", False)
 
     running = True
     clock = pygame.time.Clock()
@@ -142,6 +143,7 @@ def run_lobby():
                 graphics_toggle.toggle(mouse_pos, mouse_clicked)
                 vision_toggle.toggle(mouse_pos, mouse_clicked)
                 history_toggle.toggle(mouse_pos, mouse_clicked)
+                tabular_toggle.toggle(mouse_pos, mouse_clicked)
 
                 if train_button.is_clicked(mouse_pos, mouse_clicked):
                     model_name = inputs[0].value or "model"
@@ -158,6 +160,8 @@ def run_lobby():
                         cmd_args.append("--show_vision")
                     if history_toggle.state:
                         cmd_args.append("--show_history")
+                    if tabular_toggle.state:
+                        cmd_args.append("--agent=tabular")
 
                     cmd_args.extend([
                         f"--name={model_name}",
@@ -180,6 +184,8 @@ def run_lobby():
                     cmd_args = ["--evaluation_mode"]
                     if not graphics_toggle.state:
                         cmd_args.append("--no_graphics")
+                    if tabular_toggle.state:
+                        cmd_args.append("--agent=tabular")
 
                     model_path = os.path.join("models", model_name)
                     if os.path.exists(model_path):
@@ -207,6 +213,7 @@ def run_lobby():
         graphics_toggle.draw(screen, font)
         vision_toggle.draw(screen, font)
         history_toggle.draw(screen, font)
+        tabular_toggle.draw(screen, font)
 
         train_button.draw(screen, font)
         eval_button.draw(screen, font)
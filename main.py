@@ -1,26 +1,77 @@
-import os
-import contextlib
 import sys
 from arg_parser import setup_argparser
+from startup import timed_import, print_import_report
+
+
+def uses_lightweight_agent(args):
+    """Evaluating a .npz checkpoint needs no TensorFlow"""
+    return (args.agent == 'dqn' and args.evaluation_mode
+            and args.load_model is not None
+            and args.load_model.endswith('.npz'))
+
+
+def validate_args(args):
+    """Exit with an error on option combinations that cannot work"""
+    if args.target_update_interval is None:
+        args.target_update_interval = (
+            1000 if args.target_update == 'hard' else 1)
+    elif args.target_update == 'hard' and args.target_update_interval <= 1:
+        print("\033[91mA hard target update needs "
+              "--target_update_interval > 1\033[0m")
+        sys.exit(1)
+    if args.prefetch < 0:
+        print("\033[91m--prefetch must be 0 or more\033[0m")
+        sys.exit(1)
+    if not 1 <= args.n_step <= 255:
+        print("\033[91m--n_step must be between 1 and 255\033[0m")
+        sys.exit(1)
+    if args.compiled_evaluation and args.policy_table:
+        print("\033[91m--compiled_evaluation plays the network itself, "
+              "it cannot use --policy_table\033[0m")
+        sys.exit(1)
+    if args.memory_size < 1:
+        print("\033[91m--memory_size must be 1 or more\033[0m")
+        sys.exit(1)
+    if args.actor_refresh_interval < 1:
+        print("\033[91m--actor_refresh_interval must be 1 or more\033[0m")
+        sys.exit(1)
+    if args.actors > 0 and not args.evaluation_mode:
+        if args.prioritized_replay:
+            print("\033[91mPrioritized replay is not supported "
+                  "with --actors\033[0m")
+            sys.exit(1)
+        if not args.no_graphics:
+            print("\033[91m--actors trains without graphics, "
+                  "add -ng\033[0m")
+            sys.exit(1)
+
+
+def create_tabular_agent(board, args):
+    if (args.actors > 0 or args.compiled_evaluation or args.prefetch > 0
+            or args.prioritized_replay or args.checkpoint_format):
+        print("\033[91mThe tabular agent does not support --actors, "
+              "--compiled_evaluation, --prefetch, --prioritized_replay "
+              "or --checkpoint_format\033[0m")
+        sys.exit(1)
+    TabularAgent = timed_import('tabular_agent').TabularAgent
+    try:
+        return TabularAgent(
+            board, learning_rate=args.learning_rate,
+            memory_size=args.memory_size,
+            keep_checkpoints=args.keep_checkpoints,
+            checkpoint_history=args.checkpoint_history,
+            state_encoder=args.state_encoder,
+            packed_replay=args.packed_replay,
+            n_step=args.n_step
+        )
+    except ValueError as e:
+        print(f"\033[91m{e}\033[0m")
+        sys.exit(1)
 
 
 def main():
     args = setup_argparser().parse_args()
 
-    with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
-        import pygame
-    from board import init_board
-    from graphics import init_graphics
-    from agent import SnakeAgent
-    from display_training_history import display_training_history
-    from training import run_training
-    from evaluation import run_evaluation
-
-    try:
-        from lobby import run_lobby
-    except ImportError:
-        run_lobby = None
-
     map_width = max(3, min(24, args.map_width))
     map_height = max(3, min(13, args.map_height))
 
@@ -30,38 +81,89 @@ def main():
         args.map_width = map_width
         args.map_height = map_height
 
-    if run_lobby is not None and args.use_lobby:
-        lobby_args, eval_mode = run_lobby()
-        if lobby_args is None:
-            return
+    if args.use_lobby:
+        try:
+            timed_import('pygame', quiet=True)
+            run_lobby = timed_import('lobby').run_lobby
+        except ImportError:
+            run_lobby = None
+
+        if run_lobby is not None:
+            import_timing = args.import_timing
+            lobby_args, eval_mode = run_lobby()
+            if lobby_args is None:
+                return
+
+            args = setup_argparser().parse_args(lobby_args)
+            args.evaluation_mode = eval_mode
+            args.import_timing = import_timing
 
-        args = setup_argparser().parse_args(lobby_args)
-        args.evaluation_mode = eval_mode
+            args.map_width = max(3, min(24, args.map_width))
+            args.map_height = max(3, min(13, args.map_height))
 
-        args.map_width = max(3, min(24, args.map_width))
-        args.map_height = max(3, min(13, args.map_height))
+    validate_args(args)
 
-    board = init_board(args.map_height, args.map_width)
-    agent = SnakeAgent(board, first_layer=args.first_layer,
-                       second_layer=args.second_layer)
+    if args.board_engine == 'numba':
+        board_class = timed_import('numba_board').init_numba_board
+    else:
+        board_class = timed_import('board').init_board
+    board = board_class(args.map_height, args.map_width)
+
+    if args.agent == 'tabular':
+        agent = create_tabular_agent(board, args)
+    elif uses_lightweight_agent(args):
+        agent = timed_import('inference').PolicyAgent(
+            board, state_encoder=args.state_encoder)
+    else:
+        SnakeAgent = timed_import('agent').SnakeAgent
+        agent = SnakeAgent(
+            board, first_layer=args.first_layer,
+            second_layer=args.second_layer,
+            memory_size=args.memory_size,
+            prioritized_replay=args.prioritized_replay,
+            target_update=args.target_update, tau=args.tau,
+            target_update_interval=args.target_update_interval,
+            policy_sync_interval=args.policy_sync_interval,
+            keep_checkpoints=args.keep_checkpoints,
+            checkpoint_history=args.checkpoint_history,
+            checkpoint_format=args.checkpoint_format or 'keras',
+            state_encoder=args.state_encoder,
+            packed_replay=args.packed_replay,
+            prefetch=args.prefetch,
+            n_step=args.n_step
+        )
     agent.evaluation_mode = args.evaluation_mode
+    if not args.evaluation_mode and args.memory_size < agent.BATCH_SIZE:
+        print(f"Warning: --memory_size below the batch size of "
+              f"{agent.BATCH_SIZE}, the agent will never train")
 
     if args.load_model:
         agent.load_model(args.load_model)
 
-    graphics = None if args.no_graphics else init_graphics(board)
+    graphics = None
+    if not args.no_graphics:
+        graphics = timed_import('graphics').init_graphics(board)
+
+    if args.evaluation_mode:
+        run = timed_import('evaluation').run_evaluation
+    else:
+        run = timed_import('training').run_training
+
+    if args.warmup:
+        timed_import('warmup').warm_up_kernels(verbose=True)
+
+    if args.import_timing:
+        print_import_report()
 
     try:
-        if args.evaluation_mode:
-            run_evaluation(agent, board, graphics, args)
-        else:
-            run_training(agent, board, graphics, args)
+        run(agent, board, graphics, args)
 
     finally:
         if graphics:
-            pygame.quit()
+            sys.modules['pygame'].quit()
 
         if not args.evaluation_mode and args.show_history:
+            from display_training_history import display_training_history
             display_training_history(agent, show_plot=args.show_history)
 
 
@@ -0,0 +1,284 @@
+import numpy as np
+import numba as nb
+from board import init_board
+
+# layout of init_numba_board.state
+HEAD_Y = 0
+HEAD_X = 1
+TAIL_Y = 2
+TAIL_X = 3
+LENGTH = 4
+BODY_START = 5
+MOVING_DIR = 6
+FREE_COUNT = 7
+STATE_SIZE = 8
+
+# rows of init_numba_board.free
+FREE_CELLS = 0  # flat indices y * size_x + x of the empty cells
+FREE_POS = 1  # index of a cell in the FREE_CELLS row, -1 when occupied
+
+EMPTY = init_board.EMPTY
+TAIL = init_board.TAIL
+HEAD = init_board.HEAD
+APPLE = init_board.APPLE
+PEPPER = init_board.PEPPER
+DIRECTIONS = np.array(init_board.DIRECTIONS, dtype=np.int64)
+
+# argument types of the compiled kernels, see get_state.py
+TABLE = nb.int8[:, ::1]
+FREE = nb.int64[:, ::1]
+BODY = nb.int64[:, ::1]
+STATE = nb.int64[::1]
+BITS = nb.int64[:, ::1]
+CELL = nb.types.UniTuple(nb.int64, 2)
+
+
+@nb.njit(nb.boolean(nb.int64), cache=True)
+def _tracked(value):
+    """Cells kept in the bitboards, see init_board._init_bitboards"""
+    return value == TAIL or value == APPLE or value == PEPPER
+
+
+@nb.njit(nb.void(TABLE, FREE, BITS, STATE, nb.int64, nb.int64, nb.int64),
+         cache=True)
+def set_cell_nb(table, free, bits, state, y, x, value):
+    """Write a cell, keep the free-cell set and bitboards in sync"""
+    old = table[y, x]
+    table[y, x] = value
+    col = table.shape[0] + x
+    if _tracked(old):
+        bits[old, y] &= ~(1 << x)
+        bits[old, col] &= ~(1 << y)
+    if _tracked(value):
+        bits[value, y] |= 1 << x
+        bits[value, col] |= 1 << y
+    if (old == EMPTY) == (value == EMPTY):
+        return
+
+    cell = y * table.shape[1] + x
+    count = state[FREE_COUNT]
+    if value == EMPTY:
+        free[FREE_CELLS, count] = cell
+        free[FREE_POS, cell] = count
+        state[FREE_COUNT] = count + 1
+    else:
+        # swap-remove: the last free cell takes the freed slot
+        pos = free[FREE_POS, cell]
+        last = free[FREE_CELLS, count - 1]
+        free[FREE_CELLS, pos] = last
+        free[FREE_POS, last] = pos
+        free[FREE_POS, cell] = -1
+        state[FREE_COUNT] = count - 1
+
+
+@nb.njit(CELL(TABLE, FREE, BITS, STATE, nb.int64), cache=True)
+def set_cell_to_random_empty_nb(table, free, bits, state, value):
+    """Uniform draw from the free-cell set, O(1) at any occupancy"""
+    count = state[FREE_COUNT]
+    if count == 0:
+        return -1, -1
+
+    cell = free[FREE_CELLS, np.random.randint(0, count)]
+    y = cell // table.shape[1]
+    x = cell % table.shape[1]
+    set_cell_nb(table, free, bits, state, y, x, value)
+    return y, x
+
+
+@nb.njit(nb.void(BODY, STATE, nb.int64, nb.int64), cache=True)
+def _push_head(body, state, y, x):
+    end = (state[BODY_START] + state[LENGTH]) % body.shape[0]
+    body[end, 0] = y
+    body[end, 1] = x
+
+
+@nb.njit(nb.void(TABLE, FREE, BITS, BODY, STATE), cache=True)
+def _pop_tail(table, free, bits, body, state):
+    start = state[BODY_START]
+    set_cell_nb(table, free, bits, state, body[start, 0], body[start, 1],
+                EMPTY)
+    state[BODY_START] = (start + 1) % body.shape[0]
+
+
+@nb.njit(nb.void(TABLE, FREE, BITS, BODY, STATE), cache=True)
+def reset_board_nb(table, free, bits, body, state):
+    size_y, size_x = table.shape
+    table[:, :] = EMPTY
+    bits[:, :] = 0
+    for cell in range(size_y * size_x):
+        free[FREE_CELLS, cell] = cell
+        free[FREE_POS, cell] = cell
+    state[FREE_COUNT] = size_y * size_x
+    state[BODY_START] = 0
+    state[LENGTH] = 3
+
+    head_y, head_x = set_cell_to_random_empty_nb(table, free, bits, state,
+                                                 HEAD)
+
+    # the segment next to the head is its first free neighbour
+    second_y = head_y
+    second_x = head_x
+    for i in range(4):
+        y = head_y + DIRECTIONS[i, 0]
+        x = head_x + DIRECTIONS[i, 1]
+        if 0 <= y < size_y and 0 <= x < size_x and table[y, x] == EMPTY:
+            second_y = y
+            second_x = x
+            state[MOVING_DIR] = (i + 2) % 4
+            break
+    set_cell_nb(table, free, bits, state, second_y, second_x, TAIL)
+
+    near_y = np.empty(4, dtype=np.int64)
+    near_x = np.empty(4, dtype=np.int64)
+    count = 0
+    for i in range(4):
+        y = second_y + DIRECTIONS[i, 0]
+        x = second_x + DIRECTIONS[i, 1]
+        if 0 <= y < size_y and 0 <= x < size_x and table[y, x] == EMPTY:
+            near_y[count] = y
+            near_x[count] = x
+            count += 1
+    if count == 0:
+        raise RuntimeError("No empty adjacent cells found")
+    pick = np.random.randint(0, count)
+    tail_y = near_y[pick]
+    tail_x = near_x[pick]
+    set_cell_nb(table, free, bits, state, tail_y, tail_x, TAIL)
+
+    body[0, 0] = tail_y
+    body[0, 1] = tail_x
+    body[1, 0] = second_y
+    body[1, 1] = second_x
+    body[2, 0] = head_y
+    body[2, 1] = head_x
+    state[HEAD_Y] = head_y
+    state[HEAD_X] = head_x
+    state[TAIL_Y] = tail_y
+    state[TAIL_X] = tail_x
+
+    set_cell_to_random_empty_nb(table, free, bits, state, APPLE)
+    set_cell_to_random_empty_nb(table, free, bits, state, APPLE)
+    set_cell_to_random_empty_nb(table, free, bits, state, PEPPER)
+
+
+@nb.njit(nb.boolean(TABLE, FREE, BITS, BODY, STATE, nb.int64), cache=True)
+def make_move_nb(table, free, bits, body, state, action):
+    size_y, size_x = table.shape
+    head_y = state[HEAD_Y]
+    head_x = state[HEAD_X]
+    new_y = head_y + DIRECTIONS[action, 0]
+    new_x = head_x + DIRECTIONS[action, 1]
+    if not (0 <= new_y < size_y and 0 <= new_x < size_x):
+        return True
+
+    cell = table[new_y, new_x]
+    if cell == TAIL:
+        if (not (new_y == state[TAIL_Y] and new_x == state[TAIL_X])
+                or state[LENGTH] == 2):
+            return True
+        _push_head(body, state, new_y, new_x)
+        set_cell_nb(table, free, bits, state, head_y, head_x, TAIL)
+        _pop_tail(table, free, bits, body, state)
+
+    elif cell == APPLE:
+        _push_head(body, state, new_y, new_x)
+        state[LENGTH] += 1
+        set_cell_nb(table, free, bits, state, head_y, head_x, TAIL)
+
+    elif cell == PEPPER:
+        length = state[LENGTH] - 1
+        if length < 1:
+            state[LENGTH] = length
+            return True
+        _push_head(body, state, new_y, new_x)
+        _pop_tail(table, free, bits, body, state)
+        _pop_tail(table, free, bits, body, state)
+        state[LENGTH] = length
+        if length > 1:
+            set_cell_nb(table, free, bits, state, head_y, head_x, TAIL)
+
+    elif cell == EMPTY:
+        _push_head(body, state, new_y, new_x)
+        set_cell_nb(table, free, bits, state, head_y, head_x, TAIL)
+        _pop_tail(table, free, bits, body, state)
+
+    start = state[BODY_START]
+    state[TAIL_Y] = body[start, 0]
+    state[TAIL_X] = body[start, 1]
+    state[HEAD_Y] = new_y
+    state[HEAD_X] = new_x
+    set_cell_nb(table, free, bits, state, new_y, new_x, HEAD)
+    state[MOVING_DIR] = action
+
+    if cell == APPLE:
+        set_cell_to_random_empty_nb(table, free, bits, state, APPLE)
+    elif cell == PEPPER:
+        set_cell_to_random_empty_nb(table, free, bits, state, PEPPER)
+    return False
+
+
+class init_numba_board(init_board):
+    """init_board with its state in preallocated arrays and a compiled step.
+
+    The snake body is a fixed-capacity ring buffer of (y, x) rows, so a
+    move costs the same whatever the snake length. head_y, head_x, table
+    and snake_segments read the same as on init_board.
+    """
+
+    def __init__(self, map_height, map_width):
+        self.size_y = map_height
+        self.size_x = map_width
+        self.table = np.zeros((map_height, map_width), dtype='int8')
+        self.body = np.zeros((map_height * map_width + 1, 2), dtype=np.int64)
+        self.free = np.zeros((2, map_height * map_width), dtype=np.int64)
+        self.state = np.zeros(STATE_SIZE, dtype=np.int64)
+        self.last_move_random = False
+        self._init_bitboards()
+        reset_board_nb(self.table, self.free, self.bitboards, self.body,
+                       self.state)
+
+    def reset(self):
+        """Reset the board to initial state"""
+        reset_board_nb(self.table, self.free, self.bitboards, self.body,
+                       self.state)
+        return self
+
+    @property
+    def head_y(self):
+        return int(self.state[HEAD_Y])
+
+    @property
+    def head_x(self):
+        return int(self.state[HEAD_X])
+
+    @property
+    def tail_y(self):
+        return int(self.state[TAIL_Y])
+
+    @property
+    def tail_x(self):
+        return int(self.state[TAIL_X])
+
+    @property
+    def length(self):
+        return int(self.state[LENGTH])
+
+    @property
+    def moving_dir(self):
+        return int(self.state[MOVING_DIR])
+
+    @property
+    def snake_segments(self):
+        """Segments from tail to head, as on init_board"""
+        rows = ((self.state[BODY_START] + np.arange(self.state[LENGTH]))
+                % self.body.shape[0])
+        return [(int(y), int(x)) for y, x in self.body[rows]]
+
+    def set_cell_to_random_empty(self, value):
+        y, x = set_cell_to_random_empty_nb(self.table, self.free,
+                                           self.bitboards, self.state, value)
+        return None if y < 0 else (y, x)
+
+    def make_move(self, action):
+        return make_move_nb(self.table, self.free, self.bitboards, self.body,
+                            self.state, action)
@@ -0,0 +1,113 @@
+import random
+import statistics
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from board import init_board
+from get_state import STATE_ENCODERS
+from warmup import warm_up_kernels
+
+
+def _make_board(board_engine, map_height, map_width):
+    if board_engine == 'numba':
+        from numba_board import init_numba_board
+        return init_numba_board(map_height, map_width)
+    return init_board(map_height, map_width)
+
+
+def _seed_everything(board_engine, seed):
+    """Seed Python, NumPy and, for the numba engine, compiled code"""
+    random.seed(seed)
+    np.random.seed(seed)
+    if board_engine == 'numba':
+        from rollout import seed_nb
+        seed_nb(seed)
+
+
+def play_evaluation_games(policy, board_engine, map_height, map_width,
+                          games, seed, max_steps=100,
+                          state_encoder='12_normalized'):
+    """Greedy games on a fresh board, same rules as evaluate_model.
+
+    Runs inside a worker process, so it only needs the NumPy policy and
+    never touches TensorFlow.
+    """
+    _seed_everything(board_engine, seed)
+    board = _make_board(board_engine, map_height, map_width)
+    encode = STATE_ENCODERS[state_encoder].encode
+
+    lengths = []
+    for _ in range(games):
+        state = encode(board)
+        done = False
+        max_length = 3
+        steps_no_food = 0
+
+        while not done and steps_no_food < max_steps:
+            action = policy.greedy_action(state)
+            old_length = board.length
+            done = board.make_move(action)
+
+            if board.length > old_length:
+                steps_no_food = 0
+                max_length = max(board.length, max_length)
+
+            steps_no_food += 1
+            state = encode(board)
+
+        lengths.append(max_length)
+        board.reset()
+
+    return lengths
+
+
+class ParallelEvaluator:
+    """Plays evaluation games on a pool of worker processes.
+
+    Each worker owns its own board. Games are split evenly and every
+    worker gets a seed derived from (seed, evaluation number, worker), so
+    a run is reproducible for a given number of workers.
+    """
+
+    def __init__(self, workers, map_height, map_width, board_engine='python',
+                 seed=0, state_encoder='12_normalized'):
+        self.workers = workers
+        self.map_height = map_height
+        self.map_width = map_width
+        self.board_engine = board_engine
+        self.seed = seed
+        self.state_encoder = state_encoder
+        self.evaluations = 0
+        # spawn, not fork: the parent holds TensorFlow state
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=warm_up_kernels
+        )
+
+    def _worker_seeds(self):
+        sequence = np.random.SeedSequence([self.seed, self.evaluations])
+        return [int(child.generate_state(1)[0])
+                for child in sequence.spawn(self.workers)]
+
+    def evaluate(self, policy, games):
+        """Mean of the best lengths over all games"""
+        shares = [games // self.workers + (w < games % self.workers)
+                  for w in range(self.workers)]
+        futures = [
+            self.executor.submit(
+                play_evaluation_games, policy, self.board_engine,
+                self.map_height, self.map_width, share, seed,
+                state_encoder=self.state_encoder
+            )
+            for share, seed in zip(shares, self._worker_seeds()) if share
+        ]
+        self.evaluations += 1
+
+        lengths = []
+        for future in futures:
+            lengths.extend(future.result())
+        return statistics.mean(lengths)
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
@@ -0,0 +1,95 @@
+import numpy as np
+import numba as nb
+
+INPUT_SIZE = 12
+DIRECTIONS = 4
+
+
+@nb.njit(nb.int64(nb.float32[::1], nb.int64), cache=True)
+def state_code_nb(state, levels):
+    """Index of a 12-feature state in a PolicyTable with that many levels.
+
+    Every direction is a digit in base 2 * levels: apple or not, times
+    levels, plus the distance, the first direction being the lowest
+    digit.
+    """
+    code = 0
+    for i in range(DIRECTIONS - 1, -1, -1):
+        apple = 1 if state[3 * i + 1] > 0.5 else 0
+        distance = int(np.rint(state[3 * i + 2] * levels))
+        code = code * 2 * levels + apple * levels + distance
+    return code
+
+
+def enumerate_states(levels, start, stop):
+    """12-feature states of the codes start..stop-1, as the encoder makes
+    them: one-hot wall-or-tail / apple and the distance over levels"""
+    codes = np.arange(start, stop, dtype=np.int64)
+    states = np.zeros((len(codes), INPUT_SIZE), dtype=np.float32)
+    inverse = 1.0 / levels  # same float64 product as the encoder
+    for i in range(DIRECTIONS):
+        digit = codes % (2 * levels)
+        codes //= 2 * levels
+        apple = digit // levels
+        states[:, 3 * i] = 1 - apple
+        states[:, 3 * i + 1] = apple
+        states[:, 3 * i + 2] = (digit % levels) * inverse
+    return states
+
+
+class PolicyTable:
+    """Greedy actions of a network for every 12_normalized state.
+
+    The 12-feature state is discrete: per direction, wall-or-tail or
+    apple, and a distance in steps of 1 / max(height, width). compile
+    runs the network once over all of them and keeps the argmax in a
+    dense array indexed by state_code_nb, so picking an action is one
+    lookup. Works wherever a NumpyPolicy is used for acting.
+    """
+
+    def __init__(self, actions, levels, q_values=None):
+        self.actions = actions
+        self.levels = levels
+        self.q_table = q_values
+
+    @classmethod
+    def compile(cls, policy, map_height, map_width, keep_q_values=False,
+                chunk_size=1 << 16):
+        """Table of policy (anything with q_values) for this map size"""
+        if policy.layer_sizes[0] != INPUT_SIZE:
+            raise ValueError("A policy table needs the 12_normalized "
+                             "state encoder")
+        levels = max(map_height, map_width)
+        size = (2 * levels) ** DIRECTIONS
+        actions = np.empty(size, dtype=np.uint8)
+        q_table = (np.empty((size, policy.layer_sizes[-1]),
+                            dtype=np.float32) if keep_q_values else None)
+        for start in range(0, size, chunk_size):
+            stop = min(size, start + chunk_size)
+            q_values = policy.q_values(enumerate_states(levels, start, stop))
+            actions[start:stop] = np.argmax(q_values, axis=1)
+            if q_table is not None:
+                q_table[start:stop] = q_values
+        return cls(actions, levels, q_table)
+
+    def greedy_action(self, state):
+        return int(self.actions[state_code_nb(state, self.levels)])
+
+    def state_codes(self, states):
+        """state_code_nb of each row of an (N, 12) matrix"""
+        states = np.asarray(states, dtype=np.float32)
+        digits = ((states[:, 1::3] > 0.5) * self.levels
+                  + np.rint(states[:, 2::3] * self.levels).astype(np.int64))
+        return digits @ (2 * self.levels) ** np.arange(DIRECTIONS)
+
+    def greedy_actions(self, states):
+        return self.actions[self.state_codes(states)].astype(np.int64)
+
+    def q_values(self, states):
+        """Stored Q values, for a table compiled with keep_q_values"""
+        if self.q_table is None:
+            raise RuntimeError("Compile with keep_q_values to keep them")
+        states = np.asarray(states, dtype=np.float32)
+        if states.ndim == 1:
+            return self.q_table[state_code_nb(states, self.levels)]
+        return self.q_table[self.state_codes(states)]
@@ -0,0 +1,102 @@
+import time
+import queue
+import threading
+import numpy as np
+
+
+class BatchPrefetcher:
+    """Samples and gathers replay batches on a background thread.
+
+    The worker keeps up to depth batches ready in a bounded queue, each
+    in its own set of preallocated arrays, so gathering the next batches
+    overlaps with the gradient step (TensorFlow and the compiled gathers
+    release the GIL). Appends and priority updates of the learner go
+    through lock, so batches never hold half-written transitions; they
+    can only miss the last few ones. Actors of distributed training
+    write to shared memory without the lock; there the sequence fence
+    of SharedReplayBuffer gives the same guarantee, its gather redrawing
+    rows overwritten while they were read.
+    """
+
+    def __init__(self, memory, batch_size, state_size, depth=2,
+                 prioritized=False):
+        self.memory = memory
+        self.batch_size = batch_size
+        self.prioritized = prioritized
+        self.lock = threading.Lock()
+        # one set per queued batch, one being filled, one being trained on
+        self.buffers = [self._allocate(batch_size, state_size)
+                        for _ in range(depth + 2)]
+        self.ready = queue.Queue(maxsize=depth)
+        self.free = queue.Queue()
+        for slot in range(len(self.buffers)):
+            self.free.put(slot)
+        self.in_use = None
+        self.error = None
+        self.busy_time = 0.0  # worker time, read with take_busy_time
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def _allocate(batch_size, state_size):
+        return (np.zeros((batch_size, state_size), dtype=np.float32),
+                np.zeros(batch_size, dtype=np.int32),
+                np.zeros(batch_size, dtype=np.float32),
+                np.zeros((batch_size, state_size), dtype=np.float32),
+                np.zeros(batch_size, dtype=np.bool_),
+                np.zeros(batch_size, dtype=np.uint8))
+
+    def _run(self):
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    slot = self.free.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                with self.lock:
+                    start = time.perf_counter()
+                    indices = self.memory.sample_indices(self.batch_size)
+                    self.memory.gather(indices, out=self.buffers[slot])
+                    weights = None
+                    if self.prioritized:
+                        weights = self.memory.importance_weights(indices)
+                    self.busy_time += time.perf_counter() - start
+                self._put((slot, indices, weights))
+        except Exception as e:
+            self.error = e
+            self._put(None)
+
+    def _put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.ready.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def next_batch(self):
+        """(batch, indices, weights) of the oldest ready batch.
+
+        batch is the tuple of ReplayBuffer.gather, valid until the
+        following call, which hands its arrays back to the worker.
+        """
+        if self.in_use is not None:
+            self.free.put(self.in_use)
+            self.in_use = None
+        item = self.ready.get()
+        if item is None:
+            raise RuntimeError("Replay prefetch failed") from self.error
+        slot, indices, weights = item
+        self.in_use = slot
+        return self.buffers[slot], indices, weights
+
+    def take_busy_time(self):
+        """Worker time since the last call"""
+        with self.lock:
+            busy_time, self.busy_time = self.busy_time, 0.0
+        return busy_time
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join()
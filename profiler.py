@@ -0,0 +1,111 @@
+import os
+import time
+
+
+class PhaseTimer:
+    """Wall time of each training phase, from time.perf_counter laps.
+
+    start() marks a point in time, lap(phase) adds the time since the
+    last mark to that phase and marks again, so consecutive laps cover a
+    step without gaps. One row per episode goes to the sidecar file,
+    with env steps and gradient updates per second, and a summary table
+    is printed every summary_interval episodes.
+
+    DETAILS are timed apart with add(): replay_wait is the part of train
+    spent waiting for a prefetched batch, prefetch the time the prefetch
+    thread spent sampling, next to the phases.
+    """
+    PHASES = ('get_state', 'get_action', 'make_move', 'train', 'render',
+              'checkpoint', 'evaluation')
+    DETAILS = ('replay_wait', 'prefetch')
+    COLUMNS = PHASES + DETAILS
+
+    def __init__(self, path, summary_interval=100):
+        self.summary_interval = max(1, summary_interval)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'a')
+        if new_file:
+            self.file.write("episode steps_per_s updates_per_s " + " ".join(
+                f"{phase}_ms" for phase in self.COLUMNS) + "\n")
+        self.phases = dict.fromkeys(self.COLUMNS, 0.0)
+        self.window = dict.fromkeys(self.COLUMNS, 0.0)
+        self.window_time = 0.0
+        self.window_steps = 0
+        self.window_updates = 0
+        self.window_episodes = 0
+        self.last = time.perf_counter()
+        self.episode_start = self.last
+        self.episode_updates = 0
+
+    def start(self):
+        self.last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] += now - self.last
+        self.last = now
+
+    def add(self, detail, seconds):
+        self.phases[detail] += seconds
+
+    def begin_episode(self, updates):
+        for phase in self.phases:
+            self.phases[phase] = 0.0
+        self.episode_updates = updates
+        self.episode_start = self.last = time.perf_counter()
+
+    def end_episode(self, episode, steps, updates):
+        elapsed = max(time.perf_counter() - self.episode_start, 1e-9)
+        updates -= self.episode_updates
+        self.file.write(
+            f"{episode} {steps / elapsed:.1f} {updates / elapsed:.1f} "
+            + " ".join(f"{self.phases[phase] * 1000:.2f}"
+                       for phase in self.COLUMNS) + "\n"
+        )
+
+        for phase, seconds in self.phases.items():
+            self.window[phase] += seconds
+        self.window_time += elapsed
+        self.window_steps += steps
+        self.window_updates += updates
+        self.window_episodes += 1
+        if self.window_episodes >= self.summary_interval:
+            self.print_summary()
+
+    def print_summary(self):
+        """Table of the phases since the last summary, then start over"""
+        if not self.window_episodes:
+            return
+        total = self.window_time
+        steps = max(1, self.window_steps)
+        print(f"\nProfile of the last {self.window_episodes} episodes:")
+        print(f"{'Phase':<12} {'Time (s)':>9} {'Share':>7} "
+              f"{'Per step (us)':>14}")
+        print("-" * 45)
+        for phase in self.PHASES:
+            seconds = self.window[phase]
+            print(f"{phase:<12} {seconds:>9.2f} {seconds / total:>7.1%} "
+                  f"{seconds / steps * 1e6:>14.1f}")
+        other = total - sum(self.window[phase] for phase in self.PHASES)
+        print(f"{'other':<12} {other:>9.2f} {other / total:>7.1%} "
+              f"{other / steps * 1e6:>14.1f}")
+        if any(self.window[detail] for detail in self.DETAILS):
+            print("-" * 45)
+            for detail in self.DETAILS:
+                seconds = self.window[detail]
+                print(f"{detail:<12} {seconds:>9.2f} "
+                      f"{seconds / total:>7.1%} "
+                      f"{seconds / steps * 1e6:>14.1f}")
+        print(f"{self.window_steps / total:.1f} steps/s, "
+              f"{self.window_updates / total:.1f} updates/s\n")
+        self.file.flush()
+
+        self.window = dict.fromkeys(self.COLUMNS, 0.0)
+        self.window_time = 0.0
+        self.window_steps = 0
+        self.window_updates = 0
+        self.window_episodes = 0
+
+    def close(self):
+        self.print_summary()
+        self.file.close()
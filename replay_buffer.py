@@ -0,0 +1,344 @@
+from collections import deque
+import numpy as np
+import numba as nb
+
+PRIORITIES = nb.float64[::1]
+INDICES = nb.int64[::1]
+COLUMNS = nb.int64[::1]
+PACKED = nb.uint8[:, ::1]
+STATES = nb.float32[:, ::1]
+
+
+@nb.njit(nb.void(nb.float32[::1], COLUMNS, COLUMNS, nb.int64,
+                 nb.uint8[::1]), cache=True)
+def _pack_state(state, flag_columns, distance_columns, levels, out):
+    flag_bytes = out.shape[0] - distance_columns.shape[0]
+    for i in range(flag_bytes):
+        out[i] = 0
+    for i in range(flag_columns.shape[0]):
+        if state[flag_columns[i]] > 0.5:
+            out[i >> 3] |= 1 << (i & 7)
+    for i in range(distance_columns.shape[0]):
+        out[flag_bytes + i] = int(
+            np.rint(state[distance_columns[i]] * levels))
+
+
+@nb.njit(nb.void(nb.uint8[::1], COLUMNS, COLUMNS, nb.float64,
+                 nb.float32[::1]), cache=True)
+def _unpack_state(packed, flag_columns, distance_columns, inverse, out):
+    flag_bytes = packed.shape[0] - distance_columns.shape[0]
+    for i in range(flag_columns.shape[0]):
+        out[flag_columns[i]] = (packed[i >> 3] >> (i & 7)) & 1
+    for i in range(distance_columns.shape[0]):
+        # same float64 product as the encoders
+        out[distance_columns[i]] = packed[flag_bytes + i] * inverse
+
+
+@nb.njit(nb.void(PACKED, nb.uint8[::1], nb.float32[::1], PACKED,
+                 nb.boolean[::1], INDICES, COLUMNS, COLUMNS, nb.float64,
+                 nb.uint8[::1], STATES, nb.int32[::1], nb.float32[::1],
+                 STATES, nb.boolean[::1], nb.uint8[::1]),
+         nogil=True, cache=True)
+def _gather_packed(states, actions, rewards, next_states, dones, indices,
+                   flag_columns, distance_columns, inverse, horizons,
+                   out_states, out_actions, out_rewards, out_next_states,
+                   out_dones, out_horizons):
+    for row in range(indices.shape[0]):
+        i = indices[row]
+        _unpack_state(states[i], flag_columns, distance_columns, inverse,
+                      out_states[row])
+        out_actions[row] = actions[i]
+        out_rewards[row] = rewards[i]
+        _unpack_state(next_states[i], flag_columns, distance_columns,
+                      inverse, out_next_states[row])
+        out_dones[row] = dones[i]
+        out_horizons[row] = horizons[i]
+
+
+class StateCodec:
+    """Lossless byte packing of the states of a registry encoder.
+
+    The 0/1 features become bits and every distance feature (a number of
+    cells over levels) one uint8, so a 12_normalized state takes 5 bytes
+    instead of 48. Decoding gives back the exact float32 values.
+    """
+
+    def __init__(self, state_size, distance_columns, levels):
+        if levels > 255:
+            raise ValueError("Distances do not fit in a byte")
+        self.state_size = state_size
+        self.distance_columns = np.array(distance_columns, dtype=np.int64)
+        self.flag_columns = np.array(
+            [i for i in range(state_size) if i not in distance_columns],
+            dtype=np.int64)
+        self.levels = levels
+        self.inverse = 1.0 / levels
+        self.packed_size = ((len(self.flag_columns) + 7) // 8
+                            + len(self.distance_columns))
+
+    @classmethod
+    def for_encoder(cls, encoder, map_height, map_width):
+        return cls(encoder.size, encoder.distance_columns,
+                   max(map_height, map_width))
+
+    def pack(self, state, out):
+        _pack_state(np.asarray(state, dtype=np.float32), self.flag_columns,
+                    self.distance_columns, self.levels, out)
+
+    def unpack(self, packed):
+        out = np.empty(self.state_size, dtype=np.float32)
+        _unpack_state(packed, self.flag_columns, self.distance_columns,
+                      self.inverse, out)
+        return out
+
+
+class ReplayBuffer:
+    """Circular transition store backed by contiguous typed arrays.
+
+    With a StateCodec the states are kept packed, with one byte actions,
+    and only decoded by gather.
+    """
+
+    def __init__(self, capacity, state_size, codec=None):
+        self.capacity = capacity
+        self.state_size = state_size
+        self.codec = codec
+        self.position = 0
+        self.size = 0
+
+        if codec is None:
+            state_shape = (capacity, state_size)
+            state_dtype = np.float32
+            action_dtype = np.int32
+        else:
+            state_shape = (capacity, codec.packed_size)
+            state_dtype = np.uint8
+            action_dtype = np.uint8
+        self.states = self._allocate('states', state_shape, state_dtype)
+        self.actions = self._allocate('actions', (capacity,), action_dtype)
+        self.rewards = self._allocate('rewards', (capacity,), np.float32)
+        self.next_states = self._allocate(
+            'next_states', state_shape, state_dtype)
+        self.dones = self._allocate('dones', (capacity,), np.bool_)
+        # steps between state and next_state, the reward being their return
+        self.horizons = self._allocate('horizons', (capacity,), np.uint8)
+
+    def _allocate(self, name, shape, dtype):
+        return np.zeros(shape, dtype=dtype)
+
+    def __len__(self):
+        return self.size
+
+    def nbytes(self):
+        """Bytes taken by the transitions"""
+        return sum(field.nbytes for field in (
+            self.states, self.actions, self.rewards, self.next_states,
+            self.dones, self.horizons))
+
+    def append(self, state, action, reward, next_state, done, horizon=1):
+        i = self.position
+        if self.codec is None:
+            self.states[i] = state
+            self.next_states[i] = next_state
+        else:
+            self.codec.pack(state, self.states[i])
+            self.codec.pack(next_state, self.next_states[i])
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.dones[i] = done
+        self.horizons[i] = horizon
+
+        self.position = (i + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def sample_indices(self, batch_size):
+        """Uniform draw with replacement, O(batch_size)"""
+        return np.random.randint(0, self.size, size=batch_size)
+
+    def gather(self, indices, out=None):
+        """(states, actions, rewards, next_states, dones, horizons) rows at
+        indices.
+
+        out, when given, is a tuple of arrays of the same layout to fill
+        in place instead of allocating new ones.
+        """
+        if self.codec is not None:
+            return self._gather_packed(indices, out)
+        fields = (self.states, self.actions, self.rewards,
+                  self.next_states, self.dones, self.horizons)
+        if out is None:
+            return tuple(field[indices] for field in fields)
+        for field, dest in zip(fields, out):
+            np.take(field, indices, axis=0, out=dest)
+        return out
+
+    def _gather_packed(self, indices, out):
+        indices = np.asarray(indices, dtype=np.int64)
+        if out is None:
+            batch_size = len(indices)
+            out = (np.empty((batch_size, self.state_size), np.float32),
+                   np.empty(batch_size, np.int32),
+                   np.empty(batch_size, np.float32),
+                   np.empty((batch_size, self.state_size), np.float32),
+                   np.empty(batch_size, np.bool_),
+                   np.empty(batch_size, np.uint8))
+        codec = self.codec
+        _gather_packed(self.states, self.actions, self.rewards,
+                       self.next_states, self.dones, indices,
+                       codec.flag_columns, codec.distance_columns,
+                       codec.inverse, self.horizons, *out)
+        return out
+
+    def sample(self, batch_size, out=None):
+        return self.gather(self.sample_indices(batch_size), out)
+
+
+class NStepAccumulator:
+    """Turns the transitions of an episode into n-step ones for memory.
+
+    append takes the same one-step transitions as a ReplayBuffer and
+    keeps the last n of them. Once it holds n, the oldest goes to memory
+    with the discounted sum of the n rewards and the newest next_state,
+    horizon n. At the end of an episode (done, or flush when the episode
+    is cut short) the rest go with the returns left and their horizons.
+    With n = 1 transitions go through unchanged.
+    """
+
+    def __init__(self, memory, n, gamma):
+        self.memory = memory
+        self.n = n
+        self.gamma = gamma
+        self.discounts = gamma ** np.arange(n)
+        # every reward is written twice, n apart, so the rewards of the
+        # window are always the slice start:start + len(window)
+        self.rewards = np.zeros(2 * n)
+        self.start = 0
+        self.window = deque()
+        self.next_state = None
+
+    def append(self, state, action, reward, next_state, done):
+        end = (self.start + len(self.window)) % self.n
+        self.rewards[end] = self.rewards[end + self.n] = reward
+        self.window.append((state, action))
+        self.next_state = next_state
+        if done:
+            self._emit_all(True)
+        elif len(self.window) == self.n:
+            self._emit(False)
+
+    def flush(self):
+        """Emit what is left of an episode that did not end in done"""
+        self._emit_all(False)
+
+    def _emit_all(self, done):
+        while self.window:
+            self._emit(done)
+        self.next_state = None
+
+    def _emit(self, done):
+        horizon = len(self.window)
+        state, action = self.window.popleft()
+        n_step_return = float(self.discounts[:horizon] @ self.rewards[
+            self.start:self.start + horizon])
+        self.memory.append(state, action, n_step_return, self.next_state,
+                           done, horizon)
+        self.start = (self.start + 1) % self.n
+
+
+@nb.njit(nb.void(PRIORITIES, INDICES, PRIORITIES), nogil=True, cache=True)
+def _sum_tree_update(tree, leaves, priorities):
+    for i in range(leaves.shape[0]):
+        node = leaves[i]
+        change = priorities[i] - tree[node]
+        while node >= 1:
+            tree[node] += change
+            node >>= 1
+
+
+@nb.njit(INDICES(PRIORITIES, nb.int64, PRIORITIES), nogil=True, cache=True)
+def _sum_tree_find(tree, capacity, values):
+    leaves = np.empty(values.shape[0], dtype=np.int64)
+    for i in range(values.shape[0]):
+        value = values[i]
+        node = 1
+        while node < capacity:
+            left = node << 1
+            if value < tree[left] or tree[left + 1] <= 0.0:
+                node = left
+            else:
+                value -= tree[left]
+                node = left + 1
+        leaves[i] = node
+    return leaves
+
+
+class SumTree:
+    """Array-based binary tree of priority sums.
+
+    Node i has children 2i and 2i + 1, the root is node 1 and the
+    priorities of the items are the leaves capacity..2 * capacity - 1.
+    Updates and prefix-sum searches are both O(log capacity).
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.tree = np.zeros(2 * capacity, dtype=np.float64)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, indices):
+        return self.tree[indices + self.capacity]
+
+    def update(self, indices, priorities):
+        _sum_tree_update(
+            self.tree,
+            np.asarray(indices, dtype=np.int64) + self.capacity,
+            np.asarray(priorities, dtype=np.float64)
+        )
+
+    def find(self, values):
+        """Items whose priority interval contains each prefix-sum value"""
+        leaves = _sum_tree_find(self.tree, self.capacity,
+                                np.asarray(values, dtype=np.float64))
+        return leaves - self.capacity
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """ReplayBuffer sampling transitions in proportion to their TD error"""
+
+    def __init__(self, capacity, state_size, alpha=0.6, beta=0.4,
+                 beta_increment=1e-5, epsilon=1e-3, codec=None):
+        super().__init__(capacity, state_size, codec)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon
+        self.max_priority = 1.0
+        self.tree = SumTree(capacity)
+
+    def append(self, state, action, reward, next_state, done, horizon=1):
+        # new transitions get the highest priority so they are seen once
+        self.tree.update([self.position], [self.max_priority])
+        super().append(state, action, reward, next_state, done, horizon)
+
+    def sample_indices(self, batch_size):
+        """Stratified proportional draw, O(batch_size * log capacity)"""
+        segment = self.tree.total() / batch_size
+        values = (np.arange(batch_size)
+                  + np.random.random(batch_size)) * segment
+        indices = self.tree.find(values)
+        return np.minimum(indices, self.size - 1)
+
+    def importance_weights(self, indices):
+        """Importance-sampling weights, normalized so the largest is 1"""
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        probabilities = self.tree.get(indices) / self.tree.total()
+        weights = (self.size * probabilities) ** -self.beta
+        return (weights / weights.max()).astype(np.float32)
+
+    def update_priorities(self, indices, td_errors):
+        priorities = (np.abs(td_errors) + self.epsilon) ** self.alpha
+        self.tree.update(indices, priorities)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
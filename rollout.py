@@ -0,0 +1,170 @@
+import numpy as np
+import numba as nb
+from numba_board import (init_numba_board, reset_board_nb, make_move_nb,
+                         TABLE, FREE, BITS, BODY, STATE, HEAD_Y, HEAD_X,
+                         TAIL_Y, TAIL_X, LENGTH)
+from get_state import (_fill_state_12_bitboard, _fill_state_16_bitboard,
+                       _fill_state_16bits)
+
+# state encoders the compiled game loop knows, see get_state.STATE_ENCODERS
+ENCODER_IDS = {'12_normalized': 0, '16_normalized': 1, '16bits': 2}
+
+WEIGHTS = nb.float32[::1]
+LAYER_SIZES = nb.int64[::1]
+RELU = nb.boolean[::1]
+VECTOR = nb.float32[::1]
+COUNTS = nb.int64[::1]
+
+
+def pack_policy(policy):
+    """NumpyPolicy as (weights, layer_sizes, relu) arrays for the kernels.
+
+    weights holds every kernel (row-major) followed by its bias, layer by
+    layer, relu flags the layers with a ReLU activation.
+    """
+    weights = np.concatenate([np.ravel(w) for w in policy.weights]).astype(
+        np.float32)
+    layer_sizes = np.array(policy.layer_sizes, dtype=np.int64)
+    relu = np.array([a == 'relu' for a in policy.activations],
+                    dtype=np.bool_)
+    return weights, layer_sizes, relu
+
+
+@nb.njit(nb.void(nb.int64), cache=True)
+def seed_nb(seed):
+    """Seed the random generator of compiled code (apart from NumPy's)"""
+    np.random.seed(seed)
+
+
+@nb.njit(nb.int64(WEIGHTS, LAYER_SIZES, RELU, VECTOR, VECTOR, VECTOR),
+         cache=True)
+def greedy_action_nb(weights, layer_sizes, relu, state, hidden_a, hidden_b):
+    """argmax of the Q values, NumpyPolicy.q_values on packed weights.
+
+    hidden_a and hidden_b are scratch vectors as long as the widest layer.
+    """
+    inputs = layer_sizes[0]
+    for i in range(inputs):
+        hidden_a[i] = state[i]
+    source = hidden_a
+    target = hidden_b
+    offset = 0
+
+    for layer in range(layer_sizes.shape[0] - 1):
+        outputs = layer_sizes[layer + 1]
+        bias = offset + inputs * outputs
+        for j in range(outputs):
+            target[j] = weights[bias + j]
+        for i in range(inputs):
+            value = source[i]
+            if value != 0.0:
+                row = offset + i * outputs
+                for j in range(outputs):
+                    target[j] += value * weights[row + j]
+        if relu[layer]:
+            for j in range(outputs):
+                if target[j] < 0.0:
+                    target[j] = 0.0
+        offset = bias + outputs
+        inputs = outputs
+        source, target = target, source
+
+    best = 0
+    for j in range(1, inputs):
+        if source[j] > source[best]:
+            best = j
+    return best
+
+
+@nb.njit(nb.void(TABLE, FREE, BITS, BODY, STATE, nb.int64, WEIGHTS,
+                 LAYER_SIZES, RELU, nb.int64, COUNTS, COUNTS), cache=True)
+def play_games_nb(table, free, bits, body, board_state, encoder, weights,
+                  layer_sizes, relu, max_steps, lengths, steps):
+    """Greedy games on one numba board, one per entry of lengths.
+
+    Same rules and bookkeeping as evaluate_model: a game ends on death or
+    after max_steps moves without food. Writes each game's best length
+    and number of moves.
+    """
+    size_y, size_x = table.shape
+    state = np.empty(layer_sizes[0], dtype=np.float32)
+    widest = layer_sizes.max()
+    hidden_a = np.empty(widest, dtype=np.float32)
+    hidden_b = np.empty(widest, dtype=np.float32)
+
+    for game in range(lengths.shape[0]):
+        reset_board_nb(table, free, bits, body, board_state)
+        done = False
+        max_length = 3
+        moves = 0
+        steps_no_food = 0
+
+        while not done and steps_no_food < max_steps:
+            head_y = board_state[HEAD_Y]
+            head_x = board_state[HEAD_X]
+            if encoder == 0:
+                _fill_state_12_bitboard(head_y, head_x, bits, size_y,
+                                        size_x, state)
+            elif encoder == 1:
+                _fill_state_16_bitboard(head_y, head_x, bits, size_y,
+                                        size_x, state)
+            else:
+                _fill_state_16bits(head_y, head_x, table,
+                                   board_state[TAIL_Y], board_state[TAIL_X],
+                                   state)
+            action = greedy_action_nb(weights, layer_sizes, relu, state,
+                                      hidden_a, hidden_b)
+
+            old_length = board_state[LENGTH]
+            done = make_move_nb(table, free, bits, body, board_state, action)
+            if board_state[LENGTH] > old_length:
+                steps_no_food = 0
+                max_length = max(board_state[LENGTH], max_length)
+            steps_no_food += 1
+            moves += 1
+
+        lengths[game] = max_length
+        steps[game] = moves
+
+
+def rollout_games(policy, map_height, map_width, games, seed=None,
+                  max_steps=100, state_encoder='12_normalized'):
+    """(lengths, steps) of greedy games played entirely in compiled code"""
+    board = init_numba_board(map_height, map_width)
+    if seed is not None:
+        seed_nb(seed)
+    lengths = np.zeros(games, dtype=np.int64)
+    steps = np.zeros(games, dtype=np.int64)
+    weights, layer_sizes, relu = pack_policy(policy)
+    play_games_nb(board.table, board.free, board.bitboards, board.body,
+                  board.state, ENCODER_IDS[state_encoder], weights,
+                  layer_sizes, relu, max_steps, lengths, steps)
+    return lengths, steps
+
+
+class RolloutEvaluator:
+    """periodic_evaluation backend that plays its games with rollout_games.
+
+    Each evaluation gets the next seed, so a run is reproducible.
+    """
+
+    def __init__(self, map_height, map_width, seed=0,
+                 state_encoder='12_normalized'):
+        self.map_height = map_height
+        self.map_width = map_width
+        self.seed = seed
+        self.state_encoder = state_encoder
+        self.evaluations = 0
+
+    def evaluate(self, policy, games):
+        """Mean of the best lengths over all games"""
+        lengths, _ = rollout_games(
+            policy, self.map_height, self.map_width, games,
+            seed=self.seed + self.evaluations,
+            state_encoder=self.state_encoder
+        )
+        self.evaluations += 1
+        return float(lengths.mean())
+
+    def close(self):
+        pass
@@ -0,0 +1,31 @@
+import time
+import importlib
+
+import_times = []  # (module name, seconds), in import order
+
+
+def timed_import(name, quiet=False):
+    """import_module that records how long the import took.
+
+    quiet hides what the module prints while loading (pygame's banner).
+    """
+    start = time.perf_counter()
+    if quiet:
+        import os
+        import contextlib
+        with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+            module = importlib.import_module(name)
+    else:
+        module = importlib.import_module(name)
+    import_times.append((name, time.perf_counter() - start))
+    return module
+
+
+def print_import_report():
+    print("\nStartup imports:")
+    print(f"{'Module':<28} {'Time (ms)':>10}")
+    print("-" * 39)
+    for name, seconds in import_times:
+        print(f"{name:<28} {seconds * 1000:>10.1f}")
+    total = sum(seconds for _, seconds in import_times)
+    print(f"{'total':<28} {total * 1000:>10.1f}\n")
@@ -0,0 +1,216 @@
+import os
+import sys
+import numpy as np
+import numba as nb
+from get_state import STATE_ENCODERS
+from get_action import get_action_safe
+from replay_buffer import ReplayBuffer, StateCodec, NStepAccumulator
+from policy_table import PolicyTable
+from checkpoint import CheckpointWriter, create_model_folder, load_q_table
+
+Q_ROWS = nb.float32[:, ::1]
+ROWS = nb.int32[::1]
+GREEDY = nb.uint8[::1]
+CODES = nb.int64[::1]
+INITIAL_ROWS = 1 << 12
+
+
+@nb.njit(nb.void(Q_ROWS, ROWS, CODES, GREEDY, CODES, nb.int32[::1],
+                 nb.float32[::1], CODES, nb.boolean[::1], nb.uint8[::1],
+                 nb.float64, nb.float64), cache=True)
+def q_learning_update_nb(q_rows, rows, row_count, greedy, codes, actions,
+                         rewards, next_codes, dones, horizons,
+                         learning_rate, gamma):
+    """One Q-learning step per transition, in order.
+
+    rows maps a state code to its row of q_rows, -1 for a state never
+    updated, whose Q values are all 0; a new row is taken at
+    row_count[0], so q_rows needs room for one per transition. greedy
+    holds the argmax of every row and is kept in sync, so the max over
+    the next state is a single read. rewards are horizon-step returns,
+    the next state is discounted by gamma ** horizon.
+    """
+    for i in range(codes.shape[0]):
+        code = codes[i]
+        row = rows[code]
+        if row < 0:
+            row = row_count[0]
+            rows[code] = row
+            row_count[0] += 1
+        action = actions[i]
+        target = rewards[i]
+        if not dones[i]:
+            next_code = next_codes[i]
+            next_row = rows[next_code]
+            if next_row >= 0:
+                target += gamma ** horizons[i] * q_rows[
+                    next_row, greedy[next_code]]
+        q_rows[row, action] += learning_rate * (
+            target - q_rows[row, action])
+
+        best = 0
+        for j in range(1, q_rows.shape[1]):
+            if q_rows[row, j] > q_rows[row, best]:
+                best = j
+        greedy[code] = best
+
+
+class TabularAgent:
+    """Q-learning on a table with a row per 12_normalized state.
+
+    Same interface and replay routine as SnakeAgent, with the network
+    replaced by a table, so it needs neither TensorFlow nor a target
+    network. Only the visited states get a row of Q values; every state
+    has an int32 row index and a uint8 greedy action, the latter being
+    all that PolicyTable and the evaluators get. Checkpoints keep only
+    the visited rows.
+    """
+    INPUT_SIZE = 12
+    OUTPUT_SIZE = 4
+    BATCH_SIZE = 64
+    GAMMA = 0.95
+
+    def __init__(self, board, learning_rate=0.1, memory_size=10000,
+                 keep_checkpoints=5, checkpoint_history=100,
+                 state_encoder='12_normalized', packed_replay=False,
+                 n_step=1):
+        if state_encoder != '12_normalized':
+            raise ValueError("The tabular agent needs the 12_normalized "
+                             "state encoder")
+        self.board = board
+        self.state_encoder = state_encoder
+        self.encoder = STATE_ENCODERS[state_encoder]
+        self.learning_rate = learning_rate
+        self.levels = max(board.size_y, board.size_x)
+        size = (2 * self.levels) ** 4
+        self.rows = np.full(size, -1, dtype=np.int32)
+        self.row_count = np.zeros(1, dtype=np.int64)
+        self.q_rows = np.zeros((INITIAL_ROWS, self.OUTPUT_SIZE),
+                               dtype=np.float32)
+        self.greedy = np.zeros(size, dtype=np.uint8)
+        self.policy = PolicyTable(self.greedy, self.levels)
+        self.epsilon = 1.0
+        self.epsilon_min = 0.01
+        self.epsilon_decay = 0.9998
+        self.prioritized_replay = False
+        self.codec = None
+        if packed_replay:
+            self.codec = StateCodec.for_encoder(self.encoder, board.size_y,
+                                                board.size_x)
+        self.memory = ReplayBuffer(memory_size, self.INPUT_SIZE, self.codec)
+        self.n_step = n_step
+        self.n_step_memory = None
+        if n_step > 1:
+            self.n_step_memory = NStepAccumulator(self.memory, n_step,
+                                                  self.GAMMA)
+        self.evaluation_mode = False
+        self.folder_name = 'models'
+        self.keep_checkpoints = keep_checkpoints
+        self.checkpoint_history = checkpoint_history
+        self.checkpoints = None
+        self.updates = 0
+
+    def get_state(self):
+        return self.encoder.encode(self.board)
+
+    def get_action(self, state):
+        return get_action_safe(self, state)
+
+    def remember(self, state, action, reward, next_state, done):
+        memory = self.n_step_memory or self.memory
+        memory.append(state, action, reward, next_state, done)
+
+    def end_episode(self):
+        """Store the n-step transitions of an episode cut short"""
+        if self.n_step_memory is not None:
+            self.n_step_memory.flush()
+
+    def train(self, state, action, reward, next_state, done):
+        self.remember(state, action, reward, next_state, done)
+        self.replay(self.BATCH_SIZE)
+
+    def replay(self, batch_size):
+        if len(self.memory) < batch_size:
+            return
+
+        indices = self.memory.sample_indices(batch_size)
+        states, actions, rewards, next_states, dones, horizons = (
+            self.memory.gather(indices))
+        self._reserve_rows(batch_size)
+        q_learning_update_nb(
+            self.q_rows, self.rows, self.row_count, self.greedy,
+            self.policy.state_codes(states), actions, rewards,
+            self.policy.state_codes(next_states), dones, horizons,
+            self.learning_rate, self.GAMMA
+        )
+        self.updates += 1
+
+        if self.epsilon > self.epsilon_min:
+            self.epsilon *= self.epsilon_decay
+
+    def _reserve_rows(self, count):
+        """Grow q_rows, doubling, until count new rows fit"""
+        needed = int(self.row_count[0]) + count
+        if needed <= len(self.q_rows):
+            return
+        capacity = len(self.q_rows)
+        while capacity < needed:
+            capacity *= 2
+        q_rows = np.zeros((capacity, self.OUTPUT_SIZE), dtype=np.float32)
+        q_rows[:len(self.q_rows)] = self.q_rows
+        self.q_rows = q_rows
+
+    def set_folder_name(self, name):
+        self.folder_name = create_model_folder(name)
+
+    def save_model(self, episode):
+        """Queue the visited rows of the table for the checkpoint writer"""
+        if self.checkpoints is None:
+            self.checkpoints = CheckpointWriter(
+                os.path.join("models", self.folder_name), None,
+                keep_last=self.keep_checkpoints,
+                keep_every=self.checkpoint_history,
+                checkpoint_format='q_table'
+            )
+        codes = np.flatnonzero(self.rows >= 0)
+        self.checkpoints.save(episode, (codes, self.q_rows[self.rows[codes]]),
+                              self.checkpoint_metadata())
+
+    def checkpoint_metadata(self):
+        return {
+            'agent': 'tabular',
+            'epsilon': self.epsilon,
+            'map_height': self.board.size_y,
+            'map_width': self.board.size_x,
+            'levels': self.levels,
+            'state_encoder': self.state_encoder,
+        }
+
+    def mark_best_model(self, episode):
+        if self.checkpoints is not None:
+            self.checkpoints.mark_best(episode)
+
+    def close(self):
+        """Wait for pending checkpoint writes"""
+        if self.checkpoints is not None:
+            self.checkpoints.close()
+            self.checkpoints = None
+
+    def load_model(self, model_path):
+        try:
+            codes, q_values, metadata = load_q_table(model_path)
+            if int(metadata['levels']) != self.levels:
+                raise ValueError("Table made for another map size")
+        except Exception:
+            print("\033[91mFailed to load model\033[0m")
+            sys.exit(1)
+        self.rows[:] = -1
+        self.greedy[:] = 0
+        self.q_rows[:] = 0
+        self.row_count[0] = 0
+        self._reserve_rows(len(codes))
+        self.rows[codes] = np.arange(len(codes), dtype=np.int32)
+        self.row_count[0] = len(codes)
+        self.q_rows[:len(codes)] = q_values
+        self.greedy[codes] = np.argmax(q_values, axis=1)
+        self.epsilon = 0.1
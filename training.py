@@ -1,6 +1,5 @@
 import os
 import statistics
-import pygame
 
 
 def evaluate_model(agent, board, evaluation_episodes):
@@ -35,10 +34,13 @@ def evaluate_model(agent, board, evaluation_episodes):
 
 def periodic_evaluation(
     episode, agent, board, eval_frequency, eval_file,
-    best_avg_length, poor_performance_c
+    best_avg_length, poor_performance_c, evaluator=None
 ):
     print(f"Evaluating model at episode {episode}...")
-    avg_length = evaluate_model(agent, board, eval_frequency)
+    if evaluator is not None:
+        avg_length = evaluator.evaluate(agent.policy, eval_frequency)
+    else:
+        avg_length = evaluate_model(agent, board, eval_frequency)
 
     record = "" if best_avg_length > avg_length else " - record!"
     evaluation_result = (
@@ -51,6 +53,7 @@ def periodic_evaluation(
     if avg_length > best_avg_length:
         best_avg_length = avg_length
         poor_performance_c = 0
+        agent.mark_best_model(episode)
         print(f"New best average length: {best_avg_length:.2f}!")
     else:
         poor_performance_c += 1
@@ -82,13 +85,40 @@ def print_evaluation_summary(evaluation_lengths):
     print(f"Maximum length achieved: {max(evaluation_lengths)}")
 
 
+def create_evaluator(agent, board, args):
+    """periodic_evaluation backend asked for by args, None to play the
+    games in this process"""
+    if args.compiled_evaluation:
+        from rollout import RolloutEvaluator
+        return RolloutEvaluator(
+            board.size_y, board.size_x, seed=args.eval_seed,
+            state_encoder=agent.state_encoder
+        )
+    if args.eval_workers > 1:
+        from parallel_evaluation import ParallelEvaluator
+        return ParallelEvaluator(
+            args.eval_workers, board.size_y, board.size_x,
+            board_engine=args.board_engine, seed=args.eval_seed,
+            state_encoder=agent.state_encoder
+        )
+    return None
+
+
 def run_training(agent, board, graphics, args):
+    if args.actors > 0:
+        from distributed import run_distributed_training
+        return run_distributed_training(agent, board, args)
+
     agent.set_folder_name(args.name)
     log_path = os.path.join("models", agent.folder_name, 'logs.txt')
     eval_path = os.path.join("models", agent.folder_name, 'evaluation.txt')
     log_file = open(log_path, 'a')
     eval_file = open(eval_path, 'a')
 
+    if graphics:
+        import pygame
+        from ui import handle_ui_events
+
     fps = 24
     step_by_step_mode = False
     wait_for_step = False
@@ -100,13 +130,26 @@ def run_training(agent, board, graphics, args):
     best_avg_length = 0
     poor_performance_count = 0
 
+    profiler = None
+    if args.profile:
+        from profiler import PhaseTimer
+        profiler = PhaseTimer(
+            os.path.join("models", agent.folder_name, 'profile.txt'))
+        agent.profiler = profiler
+
+    evaluator = create_evaluator(agent, board, args)
+
     try:
         episode = 0
         for episode in range(1, episodes):
             if not running:
                 break
 
+            if profiler:
+                profiler.begin_episode(agent.updates)
             state = agent.get_state()
+            if profiler:
+                profiler.lap('get_state')
 
             total_reward = 0
             done = False
@@ -150,7 +193,6 @@ def run_training(agent, board, graphics, args):
                     print()
 
                 if graphics:
-                    from ui import handle_ui_events
                     running, step_by_step_mode, wait_for_step, fps = (
                         handle_ui_events(
                             graphics, step_by_step_mode, wait_for_step, fps
@@ -164,7 +206,11 @@ def run_training(agent, board, graphics, args):
                 if not running:
                     break
 
+                if profiler:
+                    profiler.start()
                 action = agent.get_action(state)
+                if profiler:
+                    profiler.lap('get_action')
                 if show_vision:
                     direction_names = ["LEFT", "UP", "RIGHT", "DOWN"]
                     print(direction_names[action])
@@ -179,9 +225,15 @@ def run_training(agent, board, graphics, args):
                 if board.length > old_length:
                     steps_no_food = 0
                     max_length = max(board.length, max_length)
+                if profiler:
+                    profiler.lap('make_move')
 
                 next_state = agent.get_state()
+                if profiler:
+                    profiler.lap('get_state')
                 agent.train(state, action, reward, next_state, done)
+                if profiler:
+                    profiler.lap('train')
                 state = next_state
 
                 steps += 1
@@ -192,6 +244,8 @@ def run_training(agent, board, graphics, args):
                     graphics.clock.tick(fps)
                     if step_by_step_mode:
                         wait_for_step = True
+                    if profiler:
+                        profiler.lap('render')
 
             log_msg = (
                 f"{episode} rwrd {total_reward:.1f} len {max_length} "
@@ -200,25 +254,40 @@ def run_training(agent, board, graphics, args):
             print(log_msg, end="")
             log_file.write(log_msg)
 
+            agent.end_episode()
             board.reset()
 
+            stop = False
             if episode % save_frequency == 0:
+                if profiler:
+                    profiler.start()
                 agent.save_model(episode)
                 log_file.flush()
+                if profiler:
+                    profiler.lap('checkpoint')
                 stop, best_avg_length, poor_performance_count = (
                     periodic_evaluation(
                         episode, agent, board, 100, eval_file,
-                        best_avg_length, poor_performance_count
+                        best_avg_length, poor_performance_count, evaluator
                     )
                 )
+                if profiler:
+                    profiler.lap('evaluation')
                 print()
-                if stop:
-                    break
+            if profiler:
+                profiler.end_episode(episode, steps, agent.updates)
+            if stop:
+                break
     finally:
+        if evaluator is not None:
+            evaluator.close()
+        if profiler:
+            profiler.close()
         log_file.close()
         eval_file.close()
         if episode > 0:
             agent.save_model(episode)
+        agent.close()
 
 
 def calculate_reward(board, old_length, done):
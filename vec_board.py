@@ -0,0 +1,216 @@
+import numpy as np
+from board import init_board
+
+
+class init_vec_board:
+    """N boards stepped together, same rules as init_board.make_move"""
+    EMPTY = init_board.EMPTY
+    TAIL = init_board.TAIL
+    HEAD = init_board.HEAD
+    APPLE = init_board.APPLE
+    PEPPER = init_board.PEPPER
+    DIRECTIONS = init_board.DIRECTIONS
+    DIRECTIONS_Y = np.array([d[0] for d in DIRECTIONS], dtype=np.int64)
+    DIRECTIONS_X = np.array([d[1] for d in DIRECTIONS], dtype=np.int64)
+
+    def __init__(self, num_boards, map_height, map_width,
+                 max_steps_no_food=100, seed=None):
+        self.num_boards = num_boards
+        self.size_y = map_height
+        self.size_x = map_width
+        self.max_steps_no_food = max_steps_no_food
+        self.rng = np.random.default_rng(seed)
+
+        n = num_boards
+        self.capacity = map_height * map_width + 1
+        self.tables = np.zeros((n, map_height, map_width), dtype=np.int8)
+        self.head_y = np.zeros(n, dtype=np.int64)
+        self.head_x = np.zeros(n, dtype=np.int64)
+        self.tail_y = np.zeros(n, dtype=np.int64)
+        self.tail_x = np.zeros(n, dtype=np.int64)
+        self.length = np.zeros(n, dtype=np.int64)
+        self.moving_dir = np.zeros(n, dtype=np.int64)
+        self.last_move_random = np.zeros(n, dtype=np.bool_)
+
+        # ring buffer of segments from tail to head, one row per board
+        self.body_y = np.zeros((n, self.capacity), dtype=np.int64)
+        self.body_x = np.zeros((n, self.capacity), dtype=np.int64)
+        self.body_start = np.zeros(n, dtype=np.int64)
+
+        self.steps_no_food = np.zeros(n, dtype=np.int64)
+        self.max_length = np.zeros(n, dtype=np.int64)
+        self.finished_max_length = np.zeros(n, dtype=np.int64)
+
+        self.reset()
+
+    def reset(self):
+        """Reset all boards to initial state"""
+        self.reset_boards(np.ones(self.num_boards, dtype=np.bool_))
+        return self
+
+    def reset_boards(self, mask):
+        idx = np.flatnonzero(mask)
+        if idx.size == 0:
+            return
+        self.tables[idx] = self.EMPTY
+        self.body_start[idx] = 0
+        self.steps_no_food[idx] = 0
+        self.last_move_random[idx] = False
+        self._init_snakes(idx)
+        self.max_length[idx] = self.length[idx]
+
+        self._spawn(idx, self.APPLE)
+        self._spawn(idx, self.APPLE)
+        self._spawn(idx, self.PEPPER)
+
+    def _spawn(self, idx, value):
+        """Put value on a uniformly drawn empty cell of each board in idx"""
+        if idx.size == 0:
+            return
+        flat = self.tables[idx].reshape(idx.size, -1)
+        keys = self.rng.random(flat.shape)
+        keys[flat != self.EMPTY] = -1.0
+        cells = keys.argmax(axis=1)
+        has_room = keys[np.arange(idx.size), cells] >= 0.0
+        idx = idx[has_room]
+        cells = cells[has_room]
+        self.tables[idx, cells // self.size_x, cells % self.size_x] = value
+
+    def _neighbours(self, y, x):
+        """Neighbour coordinates and emptiness for every direction"""
+        ny = y[:, None] + self.DIRECTIONS_Y[None, :]
+        nx = x[:, None] + self.DIRECTIONS_X[None, :]
+        inside = ((ny >= 0) & (ny < self.size_y)
+                  & (nx >= 0) & (nx < self.size_x))
+        return ny, nx, inside
+
+    def _init_snakes(self, idx):
+        """Initialize snakes with head and two tail segments"""
+        k = idx.size
+        rows = np.arange(k)
+        cells = self.rng.integers(0, self.size_y * self.size_x, size=k)
+        head_y = cells // self.size_x
+        head_x = cells % self.size_x
+        self.tables[idx, head_y, head_x] = self.HEAD
+
+        # first free neighbour of the head, in DIRECTIONS order
+        ny, nx, free = self._neighbours(head_y, head_x)
+        free[free] = (self.tables[np.repeat(idx, 4).reshape(k, 4)[free],
+                                  ny[free], nx[free]] == self.EMPTY)
+        first = free.argmax(axis=1)
+        second_y = ny[rows, first]
+        second_x = nx[rows, first]
+        self.moving_dir[idx] = (first + 2) % 4  # opposite of that direction
+        self.tables[idx, second_y, second_x] = self.TAIL
+
+        # random free neighbour of the second segment
+        ny, nx, free = self._neighbours(second_y, second_x)
+        free[free] = (self.tables[np.repeat(idx, 4).reshape(k, 4)[free],
+                                  ny[free], nx[free]] == self.EMPTY)
+        keys = np.where(free, self.rng.random((k, 4)), -1.0)
+        pick = keys.argmax(axis=1)
+        tail_y = ny[rows, pick]
+        tail_x = nx[rows, pick]
+        self.tables[idx, tail_y, tail_x] = self.TAIL
+
+        self.body_y[idx, 0] = tail_y
+        self.body_x[idx, 0] = tail_x
+        self.body_y[idx, 1] = second_y
+        self.body_x[idx, 1] = second_x
+        self.body_y[idx, 2] = head_y
+        self.body_x[idx, 2] = head_x
+
+        self.head_y[idx] = head_y
+        self.head_x[idx] = head_x
+        self.tail_y[idx] = tail_y
+        self.tail_x[idx] = tail_x
+        self.length[idx] = 3
+
+    def _pop_tail(self, idx):
+        """Clear the tail cell of each board in idx and drop the segment"""
+        start = self.body_start[idx]
+        self.tables[idx, self.body_y[idx, start],
+                    self.body_x[idx, start]] = self.EMPTY
+        self.body_start[idx] = (start + 1) % self.capacity
+
+    def make_moves(self, actions):
+        """Apply one action per board. Returns (dones, growth).
+
+        Finished boards are left as they are, call reset_boards or use
+        step to restart them.
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        n = self.num_boards
+        boards = np.arange(n)
+        tables = self.tables
+        length = self.length
+        old_length = length.copy()
+
+        new_y = self.head_y + self.DIRECTIONS_Y[actions]
+        new_x = self.head_x + self.DIRECTIONS_X[actions]
+        inside = ((new_y >= 0) & (new_y < self.size_y)
+                  & (new_x >= 0) & (new_x < self.size_x))
+
+        cell = np.full(n, -1, dtype=np.int8)
+        cell[inside] = tables[boards[inside], new_y[inside], new_x[inside]]
+
+        on_tail = (new_y == self.tail_y) & (new_x == self.tail_x)
+        tail_hit = cell == self.TAIL
+        apple = cell == self.APPLE
+        pepper = cell == self.PEPPER
+
+        length[pepper] -= 1
+        dones = (~inside | (tail_hit & (~on_tail | (length == 2)))
+                 | (pepper & (length < 1)))
+        live = ~dones
+        moved = live & ((cell == self.EMPTY) | tail_hit)
+        apple &= live
+        pepper &= live
+        length[apple] += 1
+
+        # the old head becomes body, unless a pepper left only the head
+        to_tail = moved | apple | (pepper & (length > 1))
+        tables[boards[to_tail], self.head_y[to_tail],
+               self.head_x[to_tail]] = self.TAIL
+
+        live_idx = np.flatnonzero(live)
+        end = ((self.body_start[live_idx] + old_length[live_idx])
+               % self.capacity)
+        self.body_y[live_idx, end] = new_y[live_idx]
+        self.body_x[live_idx, end] = new_x[live_idx]
+
+        self._pop_tail(np.flatnonzero(moved))
+        pepper_idx = np.flatnonzero(pepper)
+        self._pop_tail(pepper_idx)
+        self._pop_tail(pepper_idx)
+
+        start = self.body_start[live_idx]
+        self.tail_y[live_idx] = self.body_y[live_idx, start]
+        self.tail_x[live_idx] = self.body_x[live_idx, start]
+        self.head_y[live_idx] = new_y[live_idx]
+        self.head_x[live_idx] = new_x[live_idx]
+        tables[live_idx, new_y[live_idx], new_x[live_idx]] = self.HEAD
+        self.moving_dir[live_idx] = actions[live_idx]
+
+        self._spawn(np.flatnonzero(apple), self.APPLE)
+        self._spawn(pepper_idx, self.PEPPER)
+
+        return dones, length - old_length
+
+    def step(self, actions):
+        """make_moves, then restart every board that died or starved.
+
+        Returns (dones, growth, finished). The best length reached in a
+        finished episode is left in finished_max_length.
+        """
+        dones, growth = self.make_moves(actions)
+
+        ate = growth > 0
+        self.steps_no_food[ate] = 0
+        np.maximum(self.max_length, self.length, out=self.max_length)
+        self.steps_no_food += 1
+
+        finished = dones | (self.steps_no_food >= self.max_steps_no_food)
+        self.finished_max_length[finished] = self.max_length[finished]
+        self.reset_boards(finished)
+        return dones, growth, finished
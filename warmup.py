@@ -0,0 +1,65 @@
+import time
+import numpy as np
+
+
+def warm_up_kernels(verbose=False):
+    """Load or compile every numba kernel and run each once on a tiny board.
+
+    The kernels are typed and cached on disk, so after the first run of
+    the project this only maps the cached machine code. Call it before
+    training, and as the initializer of worker pools, so the first
+    episode does not pay for compilation.
+    """
+    start = time.perf_counter()
+    from numba_board import init_numba_board
+    from get_state import (DIRECTIONS_ARRAY, STATE_ENCODERS,
+                           get_state_12_normalized_numba,
+                           get_state_16_normalized_numba)
+    from vec_board import init_vec_board
+    from replay_buffer import PrioritizedReplayBuffer, StateCodec
+    from inference import NumpyPolicy
+    from rollout import rollout_games
+    from tabular_agent import q_learning_update_nb
+
+    board = init_numba_board(3, 3)
+    board.make_move(board.moving_dir)
+    board.reset()
+
+    get_state_12_normalized_numba(
+        board.head_y, board.head_x, board.table, DIRECTIONS_ARRAY,
+        board.TAIL, board.APPLE, board.size_y, board.size_x
+    )
+    get_state_16_normalized_numba(
+        board.head_y, board.head_x, board.table, board.tail_y, board.tail_x,
+        DIRECTIONS_ARRAY, board.TAIL, board.APPLE, board.PEPPER,
+        board.size_y, board.size_x
+    )
+    boards = init_vec_board(2, 3, 3)
+    for encoder in STATE_ENCODERS.values():
+        encoder.encode(board)
+        encoder.encode_batch(boards)
+
+    for name, encoder in STATE_ENCODERS.items():
+        policy = NumpyPolicy([np.zeros((encoder.size, 4)), np.zeros(4)],
+                             ['linear'])
+        rollout_games(policy, 3, 3, 1, state_encoder=name)
+
+    codes = np.zeros(1, dtype=np.int64)
+    q_learning_update_nb(
+        np.zeros((1, 4), dtype=np.float32), np.full(1, -1, dtype=np.int32),
+        np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.uint8),
+        codes, np.zeros(1, dtype=np.int32), np.zeros(1, dtype=np.float32),
+        codes, np.zeros(1, dtype=np.bool_), np.ones(1, dtype=np.uint8),
+        0.1, 0.95
+    )
+
+    memory = PrioritizedReplayBuffer(2, 1)
+    memory.append(np.zeros(1), 0, 0.0, np.zeros(1), False)
+    memory.update_priorities(memory.sample_indices(1), np.ones(1))
+    memory = PrioritizedReplayBuffer(2, 2, codec=StateCodec(2, (1,), 3))
+    memory.append(np.zeros(2), 0, 0.0, np.zeros(2), False)
+    memory.sample(1)
+
+    if verbose:
+        print(f"Kernels warmed up in "
+              f"{(time.perf_counter() - start) * 1000:.0f} ms")